@@ -1,27 +1,82 @@
+import re
+import asyncio
+import threading
 import uuid
-from fastapi import FastAPI, HTTPException, Depends, Cookie
+import hashlib
+import secrets
+from datetime import datetime
+from fastapi import FastAPI, HTTPException, Depends, Cookie, Header, Query, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 from typing import Optional
 
 from src.chatbot import Chatbot
+from src.degradation import degradation_policy
+from src.config import (
+    MAX_HISTORY_TURNS, WRITE_BEHIND_ENABLED, ADMIN_TOKEN, AUTH_TOKEN_TTL_SECONDS,
+    VOICE_GATEWAY_ENABLED, VOICE_MAX_SESSIONS
+)
 from database.db import (
-    init_db, create_session, save_message,
-    get_session_messages, delete_session, save_feedback,
-    create_user, authenticate_user, get_user_sessions, get_user_by_id,
-    update_user, delete_user
+    init_db, close_pool, create_session, save_message,
+    get_session_messages_page, get_recent_messages, delete_session, save_feedback,
+    create_user, authenticate_user, get_user_sessions_page, get_user_by_id, get_token_version,
+    update_user, delete_user, get_session_version, get_user_sessions_version,
+    search_messages
 )
+from database.write_behind import write_behind
+from database.maintenance import maintenance_scheduler
+from database.export import iter_messages, iter_ndjson_gzip
+from utils.auth import create_token, verify_token
+from utils.admission import admission, AdmissionRejected
+from utils import metrics
+from utils.tracing import trace_request, write_trace, new_request_id, current_request_id, span, close_trace_writer
+from utils.profiling import profiler
+from utils.voice_gateway import speech_pool, VoiceSession
+
+if WRITE_BEHIND_ENABLED:
+    # Chat and feedback writes are committed in the background
+    save_message = write_behind.save_message
+    save_feedback = write_behind.save_feedback
 
 
 sessions: dict[str, Chatbot] = {}
 
+# Live values computed at scrape time
+metrics.registry.register(metrics.Gauge(
+    "chatbot_session_cache_size", "Chatbot instances held in memory", lambda: len(sessions)))
+metrics.registry.register(metrics.Gauge(
+    "chatbot_chat_queue_depth", "Chat requests waiting for a pipeline slot", lambda: admission.queued))
+metrics.registry.register(metrics.Gauge(
+    "chatbot_chat_running", "Chat pipelines currently running", lambda: admission.running))
+metrics.registry.register(metrics.Gauge(
+    "chatbot_degradation_level", "Current degradation level (0 = full quality)",
+    lambda: degradation_policy.current().level))
+metrics.registry.register(metrics.Gauge(
+    "chatbot_voice_sessions", "Open /api/voice connections", lambda: speech_pool.sessions))
+
+def forget_sessions(session_ids):
+    """Drop cached Chatbots whose DB rows were deleted, so the next chat recreates the session row."""
+    for session_id in session_ids:
+        sessions.pop(session_id, None)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    if WRITE_BEHIND_ENABLED:
+        write_behind.start()
+    maintenance_scheduler.start(on_archived=forget_sessions)
+    if VOICE_GATEWAY_ENABLED:
+        speech_pool.start()
     yield
+    speech_pool.stop()
     sessions.clear()
+    maintenance_scheduler.stop()
+    admission.shutdown()
+    write_behind.stop()
+    close_pool()
+    close_trace_writer()
 
 app = FastAPI(title="Kumaoni Chatbot API", lifespan=lifespan)
 
@@ -31,8 +86,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+@app.middleware("http")
+async def tracing_middleware(request: Request, call_next):
+    # Honour an upstream request id so traces can be joined with proxy/client logs
+    request_id = request.headers.get("x-request-id", "")
+    if not REQUEST_ID_PATTERN.match(request_id):
+        request_id = new_request_id()
+    with trace_request(request_id, method=request.method, path=request.url.path) as trace:
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            response.headers["X-Request-ID"] = request_id
+            return response
+        finally:
+            write_trace(trace, status=status)
+
 class SignUpRequest(BaseModel):
     email: str
     password: str
@@ -52,15 +126,48 @@ class ChatResponse(BaseModel):
     retrieved_examples: list[dict]
     session_id: str
     message_id: int
+    degradation_level: int = 0
 
 class FeedbackRequest(BaseModel):
     message_id: int
     rating: int
     comment: str | None = None
 
+def make_etag(*parts) -> str:
+    return '"' + hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest() + '"'
+
+def not_modified(etag: str, if_none_match: Optional[str]) -> bool:
+    return if_none_match is not None and etag in [tag.strip() for tag in if_none_match.split(",")]
+
+def cached_json(content: dict, etag: str) -> JSONResponse:
+    # no-cache: the browser may keep the body but must revalidate with If-None-Match
+    return JSONResponse(content=content, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.registry.expose(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/health")
 def health_check():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "admission": admission.stats(),
+        "degradation_level": degradation_policy.current().level
+    }
+
+AUTH_COOKIE = "session_token"
+
+def current_user(session_token: Optional[str] = Cookie(None)) -> dict | None:
+    """User claims from the signed session cookie, or None if revoked or the account is gone."""
+    claims = verify_token(session_token) if session_token else None
+    # The version comes from the user cache, so this is normally not a DB hit
+    if claims and claims.pop("ver") != get_token_version(claims["id"]):
+        return None
+    return claims
+
+def set_auth_cookie(response: JSONResponse, user: dict):
+    token = create_token(user, get_token_version(user["id"]))
+    response.set_cookie(key=AUTH_COOKIE, value=token, httponly=True, samesite="lax", max_age=AUTH_TOKEN_TTL_SECONDS)
 
 @app.post("/api/auth/signup")
 def signup(request: SignUpRequest):
@@ -68,7 +175,7 @@ def signup(request: SignUpRequest):
     if not user:
         raise HTTPException(status_code=400, detail="Email already exists")
     response = JSONResponse(content={"user": user})
-    response.set_cookie(key="user_id", value=str(user["id"]), httponly=True, max_age=86400*30)
+    set_auth_cookie(response, user)
     return response
 
 @app.post("/api/auth/signin")
@@ -77,100 +184,251 @@ def signin(request: SignInRequest):
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     response = JSONResponse(content={"user": user})
-    response.set_cookie(key="user_id", value=str(user["id"]), httponly=True, max_age=86400*30)
+    set_auth_cookie(response, user)
     return response
 
 @app.post("/api/auth/signout")
 def signout():
     response = JSONResponse(content={"status": "ok"})
-    response.delete_cookie(key="user_id")
+    response.delete_cookie(key=AUTH_COOKIE)
     return response
 
 @app.get("/api/auth/me")
-def get_current_user(user_id: Optional[str] = Cookie(None)):
-    if not user_id:
+def get_current_user(user: Optional[dict] = Depends(current_user)):
+    if not user:
         return {"user": None}
-    user = get_user_by_id(int(user_id))
-    return {"user": user}
+    return {"user": get_user_by_id(user["id"])}
 
 class UpdateUserRequest(BaseModel):
     name: str | None = None
     password: str | None = None
 
 @app.put("/api/auth/update")
-def update_user_endpoint(request: UpdateUserRequest, user_id: Optional[str] = Cookie(None)):
-    if not user_id:
+def update_user_endpoint(request: UpdateUserRequest, user: Optional[dict] = Depends(current_user)):
+    if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    user = update_user(int(user_id), request.name, request.password)
-    return {"user": user}
+    updated = update_user(user["id"], request.name, request.password)
+    response = JSONResponse(content={"user": updated})
+    if updated:
+        # Re-issue so the token carries the new name
+        set_auth_cookie(response, updated)
+    return response
 
 @app.delete("/api/auth/delete")
-def delete_user_endpoint(user_id: Optional[str] = Cookie(None)):
-    if not user_id:
+def delete_user_endpoint(user: Optional[dict] = Depends(current_user)):
+    if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    delete_user(int(user_id))
+    write_behind.flush()
+    forget_sessions(delete_user(user["id"]))
     response = JSONResponse(content={"status": "deleted"})
-    response.delete_cookie(key="user_id")
+    response.delete_cookie(key=AUTH_COOKIE)
     return response
 
 @app.delete("/api/sessions/{session_id}")
-def delete_session_endpoint(session_id: str, user_id: Optional[str] = Cookie(None)):
-    if session_id in sessions:
-        del sessions[session_id]
+def delete_session_endpoint(session_id: str, user: Optional[dict] = Depends(current_user)):
+    sessions.pop(session_id, None)
+    write_behind.flush()
     delete_session(session_id)
     return {"status": "deleted"}
 
 @app.get("/api/sessions")
-def list_sessions(user_id: Optional[str] = Cookie(None)):
-    if not user_id:
-        return {"sessions": []}
-    user_sessions = get_user_sessions(int(user_id))
+def list_sessions(
+    user: Optional[dict] = Depends(current_user),
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    if not user:
+        return {"sessions": [], "next_cursor": None}
+    etag = make_etag("sessions", user["id"], get_user_sessions_version(user["id"]), limit, cursor)
+    if not_modified(etag, if_none_match):
+        return Response(status_code=304, headers={"ETag": etag})
+    try:
+        user_sessions, next_cursor = get_user_sessions_page(user["id"], limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    return {"sessions": user_sessions}
+    return cached_json({"sessions": user_sessions, "next_cursor": next_cursor}, etag)
 
 @app.post("/api/chat", response_model=ChatResponse)
-def chat(request: ChatRequest, user_id: Optional[str] = Cookie(None)):
+async def chat(request: ChatRequest, http_request: Request, user: Optional[dict] = Depends(current_user)):
     session_id = request.session_id or str(uuid.uuid4())
-    
+    user_key = f"user:{user['id']}" if user else f"ip:{http_request.client.host if http_request.client else 'unknown'}"
+    # A client that hangs up (e.g. the voice client's user spoke again) must not get an unheard reply stored
+    superseded = threading.Event()
+    watcher = asyncio.create_task(_watch_disconnect(http_request, superseded))
+    try:
+        async with admission.admit(user_key, session_id):
+            result = await admission.run(run_chat_turn, request.message, session_id, user, superseded)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+    finally:
+        watcher.cancel()
+    if result is None:
+        return Response(status_code=499)  # Nobody is listening any more
+    return result
+
+async def _watch_disconnect(request: Request, disconnected: threading.Event):
+    # The body is already read, so the next ASGI message is the disconnect.
+    # (request.is_disconnected() can't see it through the HTTP middleware.)
+    if (await request.receive())["type"] == "http.disconnect":
+        disconnected.set()
+
+@app.websocket("/api/voice")
+async def voice(websocket: WebSocket, session_id: Optional[str] = None):
+    """Streamed voice chat; see utils/voice_gateway.py for the protocol."""
+    if not speech_pool.ready or speech_pool.sessions >= VOICE_MAX_SESSIONS:
+        await websocket.close(code=1013)  # Try again later
+        return
+    token = websocket.cookies.get(AUTH_COOKIE)
+    user = current_user(token)
+    session_id = session_id or str(uuid.uuid4())
+    user_key = f"user:{user['id']}" if user else f"ip:{websocket.client.host if websocket.client else 'unknown'}"
+
+    async def chat_turn(text: str) -> ChatResponse:
+        # Same admission and tracing as POST /api/chat
+        with trace_request(new_request_id(), method="WS", path="/api/voice") as trace:
+            status = 500
+            superseded = threading.Event()
+            try:
+                async with admission.admit(user_key, session_id):
+                    result = await admission.run(run_chat_turn, text, session_id, user, superseded, on_cancel=superseded.set)
+                status = 200
+                return result
+            except AdmissionRejected as e:
+                status = e.status_code
+                raise
+            except asyncio.CancelledError:
+                status = 499  # Superseded by a newer utterance
+                raise
+            finally:
+                write_trace(trace, status=status)
+
+    await websocket.accept()
+    await VoiceSession(websocket, chat_turn, speech_pool).run()
+
+def run_chat_turn(message: str, session_id: str, user: Optional[dict],
+                  superseded: Optional[threading.Event] = None) -> Optional[ChatResponse]:
+    """One blocking chat pipeline; runs on the admission executor.
+
+    Returns None without saving anything if superseded is set before the
+    reply is stored (a voice turn cut off by a newer utterance).
+    """
+    try:
+        with metrics.chat_seconds.time(), profiler.profile(current_request_id() or new_request_id()):
+            return _chat_turn(message, session_id, user, superseded)
+    except Exception:
+        metrics.errors.inc(component="chat")
+        raise
+
+def _chat_turn(message: str, session_id: str, user: Optional[dict],
+               superseded: Optional[threading.Event] = None) -> Optional[ChatResponse]:
     if session_id not in sessions:
         sessions[session_id] = Chatbot()
-        create_session(session_id, int(user_id) if user_id else None)
+        create_session(session_id, user["id"] if user else None)
         
-        existing = get_session_messages(session_id)
-        for msg in existing:
-            sessions[session_id].context_manager.add_message(msg["role"], msg["content"])
+        # The cached Chatbot may have been dropped with its last exchange still queued
+        write_behind.flush()
+        existing = get_recent_messages(session_id, MAX_HISTORY_TURNS * 2)
+        sessions[session_id].context_manager.load_messages(existing)
     
     chatbot = sessions[session_id]
-    result = chatbot.chat(request.message)
+    with span("chatbot.chat", session_id=session_id):
+        result = chatbot.chat(message)
     
-    save_message(session_id, "user", request.message, result["english_meaning"])
-    message_id = save_message(session_id, "assistant", result["reply"])
+    if superseded is not None and superseded.is_set():
+        # Nobody will hear this reply; drop the cached Chatbot so its history
+        # is reloaded from the stored messages, which never saw this turn
+        sessions.pop(session_id, None)
+        return None
+    
+    save_message(session_id, "user", message, result["english_meaning"])
+    message_id = save_message(session_id, "assistant", result["reply"], degradation_level=result["degradation_level"])
     
     return ChatResponse(
         reply=result["reply"],
         english_meaning=result["english_meaning"],
         retrieved_examples=result["retrieved_examples"],
         session_id=session_id,
-        message_id=message_id
+        message_id=message_id,
+        degradation_level=result["degradation_level"]
     )
 
 @app.get("/api/history/{session_id}")
-def get_history(session_id: str):
-    messages = get_session_messages(session_id)
-    return {"messages": messages}
+def get_history(
+    session_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    write_behind.flush()
+    etag = make_etag("history", session_id, get_session_version(session_id), limit, cursor)
+    if not_modified(etag, if_none_match):
+        return Response(status_code=304, headers={"ETag": etag})
+    try:
+        messages, next_cursor = get_session_messages_page(session_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return cached_json({"messages": messages, "next_cursor": next_cursor}, etag)
+
+@app.get("/api/search")
+def search(
+    q: str,
+    user: Optional[dict] = Depends(current_user),
+    role: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    results = search_messages(q, user["id"], role, limit, offset)
+    next_offset = offset + limit if len(results) == limit else None
+    return {"results": results, "next_offset": next_offset}
 
 @app.post("/api/reset/{session_id}")
 def reset_session(session_id: str):
-    if session_id in sessions:
-        sessions[session_id].reset()
+    # The session row is deleted, so the next chat must go through create_session again
+    sessions.pop(session_id, None)
+    write_behind.flush()
     delete_session(session_id)
     return {"status": "reset"}
 
 @app.post("/api/feedback")
 def submit_feedback(request: FeedbackRequest):
-    save_feedback(request.message_id, request.rating, request.comment)
+    if not save_feedback(request.message_id, request.rating, request.comment):
+        raise HTTPException(status_code=404, detail="Message not found")
     return {"status": "saved"}
 
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.get("/api/admin/export", dependencies=[Depends(require_admin)])
+def export_messages(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    min_rating: Optional[int] = None,
+    max_rating: Optional[int] = None
+):
+    write_behind.flush()
+    rows = iter_messages(since, until, min_rating, max_rating)
+    return StreamingResponse(
+        iter_ndjson_gzip(rows),
+        media_type="application/gzip",
+        headers={"Content-Disposition": 'attachment; filename="messages.ndjson.gz"'}
+    )
+
+@app.get("/api/admin/search", dependencies=[Depends(require_admin)])
+def admin_search(
+    q: str,
+    role: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    results = search_messages(q, None, role, limit, offset)
+    next_offset = offset + limit if len(results) == limit else None
+    return {"results": results, "next_offset": next_offset}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
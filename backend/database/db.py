@@ -1,220 +1,600 @@
 import sqlite3
 import hashlib
 import secrets
-from datetime import datetime
+import queue
+import json
+import base64
+import functools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
-from src.config import DATABASE_PATH
+from utils.metrics import db_seconds
+from utils.tracing import span
+from src.config import (
+    DATABASE_PATH, DB_POOL_SIZE, DB_MMAP_SIZE, DB_STATEMENT_CACHE_SIZE,
+    USER_CACHE_TTL_SECONDS, USER_CACHE_SIZE
+)
+
+def utc_timestamp(when: datetime = None) -> str:
+    """
+    UTC in CURRENT_TIMESTAMP's format plus microseconds (so ETag versions change
+    within a second); sorts correctly against plain CURRENT_TIMESTAMP values.
+    """
+    return (when or datetime.now(timezone.utc)).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+# Idle connections, reused across requests and threads
+_pool: queue.LifoQueue = queue.LifoQueue(maxsize=DB_POOL_SIZE)
 
 def get_connection():
+    """Open a new connection with WAL journaling and tuned pragmas."""
     DATABASE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = sqlite3.connect(
+        DATABASE_PATH,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE_SIZE
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA foreign_keys=ON")
     return conn
 
-def init_db():
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            name TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS sessions (
-            id TEXT PRIMARY KEY,
-            user_id INTEGER,
-            title TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT NOT NULL,
-            role TEXT NOT NULL,
-            content TEXT NOT NULL,
-            english_meaning TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (session_id) REFERENCES sessions(id)
-        )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS feedback (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            message_id INTEGER NOT NULL,
-            rating INTEGER,
-            comment TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (message_id) REFERENCES messages(id)
-        )
-    """)
+@contextmanager
+def connection():
+    """Borrow a pooled connection; any open transaction is rolled back on return."""
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = get_connection()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def _timed(fn):
+    """Record the operation's latency in chatbot_db_seconds and as a trace span."""
+    name = fn.__name__
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(f"db.{name}"), db_seconds.time(op=name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def close_pool():
+    """Close all idle pooled connections."""
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+# Schema migrations, applied in order. PRAGMA user_version records how many have run.
+MIGRATIONS = [
+    # 1: secondary indexes, and the first message denormalized onto the session row
+    [
+        "CREATE INDEX IF NOT EXISTS idx_messages_session_created ON messages(session_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_user_updated ON sessions(user_id, updated_at)",
+        "CREATE INDEX IF NOT EXISTS idx_feedback_message ON feedback(message_id)",
+        "ALTER TABLE sessions ADD COLUMN first_message TEXT",
+        """UPDATE sessions SET first_message = (
+               SELECT content FROM messages WHERE session_id = sessions.id
+               ORDER BY created_at, id LIMIT 1
+           )""",
+    ],
+    # 2: rebuild child tables with ON DELETE CASCADE foreign keys (SQLite cannot alter them in place).
+    # Sessions of unknown users are kept as anonymous, like create_session does; only rows
+    # with no parent at all are dropped.
+    [
+        "UPDATE sessions SET user_id = NULL WHERE user_id IS NOT NULL AND user_id NOT IN (SELECT id FROM users)",
+        "DELETE FROM messages WHERE session_id NOT IN (SELECT id FROM sessions)",
+        "DELETE FROM feedback WHERE message_id NOT IN (SELECT id FROM messages)",
+        """CREATE TABLE sessions_new (
+               id TEXT PRIMARY KEY,
+               user_id INTEGER,
+               title TEXT,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               first_message TEXT,
+               FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+           )""",
+        """INSERT INTO sessions_new (id, user_id, title, created_at, updated_at, first_message)
+           SELECT id, user_id, title, created_at, updated_at, first_message FROM sessions""",
+        "DROP TABLE sessions",
+        "ALTER TABLE sessions_new RENAME TO sessions",
+        """CREATE TABLE messages_new (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               session_id TEXT NOT NULL,
+               role TEXT NOT NULL,
+               content TEXT NOT NULL,
+               english_meaning TEXT,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               FOREIGN KEY (session_id) REFERENCES sessions(id) ON DELETE CASCADE
+           )""",
+        """INSERT INTO messages_new (id, session_id, role, content, english_meaning, created_at)
+           SELECT id, session_id, role, content, english_meaning, created_at FROM messages""",
+        "DROP TABLE messages",
+        "ALTER TABLE messages_new RENAME TO messages",
+        """CREATE TABLE feedback_new (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               message_id INTEGER NOT NULL,
+               rating INTEGER,
+               comment TEXT,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               FOREIGN KEY (message_id) REFERENCES messages(id) ON DELETE CASCADE
+           )""",
+        """INSERT INTO feedback_new (id, message_id, rating, comment, created_at)
+           SELECT id, message_id, rating, comment, created_at FROM feedback""",
+        "DROP TABLE feedback",
+        "ALTER TABLE feedback_new RENAME TO feedback",
+        "CREATE INDEX idx_messages_session_created ON messages(session_id, created_at)",
+        "CREATE INDEX idx_sessions_user_updated ON sessions(user_id, updated_at)",
+        "CREATE INDEX idx_feedback_message ON feedback(message_id)",
+    ],
+    # 3: FTS5 full-text index over message content, kept in sync by triggers
+    [
+        """CREATE VIRTUAL TABLE messages_fts USING fts5(
+               content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+           )""",
+        """CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+               INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+           END""",
+        """CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+               INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+           END""",
+        """CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+               INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+               INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+           END""",
+        "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')",
+    ],
+    # 4: degradation level the reply was produced at, to correlate with feedback
+    [
+        "ALTER TABLE messages ADD COLUMN degradation_level INTEGER",
+    ],
+    # 5: bumped on password change so earlier signed tokens stop verifying
+    [
+        "ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0",
+    ],
+    # 6: updated_at used to be written in host local time by Python (the values with
+    # fractional seconds); convert those to UTC like the CURRENT_TIMESTAMP ones
+    [
+        """UPDATE sessions SET updated_at = strftime('%Y-%m-%d %H:%M:%f', updated_at, 'utc')
+           WHERE updated_at LIKE '%.%' OR updated_at LIKE '%T%'""",
+    ],
+]
+
+def migrate(conn: sqlite3.Connection):
+    """Apply pending schema migrations, one transaction per version."""
+    # Table rebuilds must not trigger FK actions; this pragma is a no-op inside a transaction
+    conn.execute("PRAGMA foreign_keys=OFF")
+    try:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                conn.rollback()
+                break
+            for statement in MIGRATIONS[version]:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+    finally:
+        conn.execute("PRAGMA foreign_keys=ON")
     
-    conn.commit()
-    conn.close()
+    # Switching to incremental auto-vacuum only takes effect after a full VACUUM (one-off)
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+
+def init_db():
+    with connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                email TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                name TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                title TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                english_meaning TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (session_id) REFERENCES sessions(id)
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS feedback (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id INTEGER NOT NULL,
+                rating INTEGER,
+                comment TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (message_id) REFERENCES messages(id)
+            )
+        """)
+        
+        conn.commit()
+        migrate(conn)
 
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
+@_timed
 def create_user(email: str, password: str, name: str) -> dict:
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute(
-            "INSERT INTO users (email, password_hash, name) VALUES (?, ?, ?)",
-            (email.lower(), hash_password(password), name)
-        )
-        conn.commit()
-        user_id = cursor.lastrowid
-        return {"id": user_id, "email": email, "name": name}
-    except sqlite3.IntegrityError:
-        return None
-    finally:
-        conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT INTO users (email, password_hash, name) VALUES (?, ?, ?)",
+                (email.lower(), hash_password(password), name)
+            )
+            conn.commit()
+            user_id = cursor.lastrowid
+            return {"id": user_id, "email": email, "name": name}
+        except sqlite3.IntegrityError:
+            return None
 
+@_timed
 def authenticate_user(email: str, password: str) -> dict:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, email, name FROM users WHERE email = ? AND password_hash = ?",
-        (email.lower(), hash_password(password))
-    )
-    row = cursor.fetchone()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, email, name FROM users WHERE email = ? AND password_hash = ?",
+            (email.lower(), hash_password(password))
+        )
+        row = cursor.fetchone()
     if row:
         return {"id": row["id"], "email": row["email"], "name": row["name"]}
     return None
 
+# user_id -> (expires_at, user or None), least recently used first
+_user_cache: OrderedDict = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+def _invalidate_user(user_id: int):
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+def _cached_user(user_id: int) -> dict:
+    now = time.monotonic()
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id)
+        if cached and cached[0] > now:
+            _user_cache.move_to_end(user_id)
+            return cached[1]
+    
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, email, name, token_version FROM users WHERE id = ?", (user_id,))
+        row = cursor.fetchone()
+    user = dict(row) if row else None
+    
+    with _user_cache_lock:
+        _user_cache[user_id] = (now + USER_CACHE_TTL_SECONDS, user)
+        _user_cache.move_to_end(user_id)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+    return user
+
+@_timed
 def get_user_by_id(user_id: int) -> dict:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, email, name FROM users WHERE id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        return {"id": row["id"], "email": row["email"], "name": row["name"]}
-    return None
+    user = _cached_user(user_id)
+    return {"id": user["id"], "email": user["email"], "name": user["name"]} if user else None
 
+def get_token_version(user_id: int) -> int | None:
+    """Current token version of the user (None if they no longer exist), from the user cache."""
+    user = _cached_user(user_id)
+    return user["token_version"] if user else None
+
+@_timed
 def update_user(user_id: int, name: str = None, password: str = None) -> dict:
-    conn = get_connection()
-    cursor = conn.cursor()
-    if name:
-        cursor.execute("UPDATE users SET name = ? WHERE id = ?", (name, user_id))
-    if password:
-        cursor.execute("UPDATE users SET password_hash = ? WHERE id = ?", (hash_password(password), user_id))
-    conn.commit()
-    cursor.execute("SELECT id, email, name FROM users WHERE id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        if name:
+            cursor.execute("UPDATE users SET name = ? WHERE id = ?", (name, user_id))
+        if password:
+            # Revokes every token issued before the change
+            cursor.execute(
+                "UPDATE users SET password_hash = ?, token_version = token_version + 1 WHERE id = ?",
+                (hash_password(password), user_id)
+            )
+        conn.commit()
+        _invalidate_user(user_id)
+        cursor.execute("SELECT id, email, name FROM users WHERE id = ?", (user_id,))
+        row = cursor.fetchone()
     if row:
         return {"id": row["id"], "email": row["email"], "name": row["name"]}
     return None
 
-def delete_user(user_id: int):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM sessions WHERE user_id = ?", (user_id,))
-    sessions = cursor.fetchall()
-    for session in sessions:
-        cursor.execute("DELETE FROM messages WHERE session_id = ?", (session["id"],))
-    cursor.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
-    cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+@_timed
+def delete_user(user_id: int) -> list[str]:
+    """Delete the user; returns the ids of their sessions, which are deleted with it."""
+    # Sessions, messages and feedback go with it via ON DELETE CASCADE
+    with connection() as conn:
+        session_ids = [row[0] for row in conn.execute("SELECT id FROM sessions WHERE user_id = ?", (user_id,))]
+        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        conn.commit()
+    _invalidate_user(user_id)
+    return session_ids
 
+@_timed
 def create_session(session_id: str, user_id: int = None, title: str = None):
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT OR IGNORE INTO sessions (id, user_id, title) VALUES (?, ?, ?)",
+                (session_id, user_id, title)
+            )
+        except sqlite3.IntegrityError:
+            # Unknown user (e.g. deleted account): keep the session anonymous
+            cursor.execute(
+                "INSERT OR IGNORE INTO sessions (id, user_id, title) VALUES (?, NULL, ?)",
+                (session_id, title)
+            )
+        conn.commit()
 
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR IGNORE INTO sessions (id, user_id, title) VALUES (?, ?, ?)",
-        (session_id, user_id, title)
-    )
-    conn.commit()
-    conn.close()
-
+@_timed
 def update_session_title(session_id: str, title: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE sessions SET title = ? WHERE id = ?", (title, session_id))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE sessions SET title = ? WHERE id = ?", (title, session_id))
+        conn.commit()
+
+def encode_cursor(*values) -> str:
+    """Opaque keyset cursor for the last row of a page."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str) -> list:
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("Invalid cursor")
+    return values
 
 def get_user_sessions(user_id: int) -> list:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """SELECT s.id, s.title, s.created_at, s.updated_at,
-           (SELECT content FROM messages WHERE session_id = s.id ORDER BY created_at LIMIT 1) as first_message
-           FROM sessions s WHERE s.user_id = ? ORDER BY s.updated_at DESC""",
-        (user_id,)
-    )
+    return get_user_sessions_page(user_id)[0]
+
+@_timed
+def get_user_sessions_page(user_id: int, limit: int = None, cursor: str = None) -> tuple[list, str | None]:
+    """Sessions newest first, keyset-paginated on (updated_at, rowid)."""
+    query = """SELECT rowid, id, title, first_message, created_at, updated_at
+               FROM sessions WHERE user_id = ?"""
+    params = [user_id]
+    if cursor:
+        query += " AND (updated_at, rowid) < (?, ?)"
+        params.extend(decode_cursor(cursor))
+    query += " ORDER BY updated_at DESC, rowid DESC"
+    if limit:
+        # One extra row tells us whether there is a next page
+        query += " LIMIT ?"
+        params.append(limit + 1)
+    
+    with connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+    
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["updated_at"], rows[-1]["rowid"])
+    
     sessions = []
-    for row in cursor.fetchall():
+    for row in rows:
         sessions.append({
             "id": row["id"],
             "title": row["title"] or row["first_message"][:50] if row["first_message"] else "New Chat",
             "created_at": row["created_at"],
             "updated_at": row["updated_at"]
         })
-    conn.close()
-    return sessions
+    return sessions, next_cursor
 
-def save_message(session_id: str, role: str, content: str, english_meaning: str = None) -> int:
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "INSERT INTO messages (session_id, role, content, english_meaning) VALUES (?, ?, ?, ?)",
-        (session_id, role, content, english_meaning)
-    )
-    
-    cursor.execute(
-        "UPDATE sessions SET updated_at = ? WHERE id = ?",
-        (datetime.now(), session_id)
-    )
-    
-    message_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+@_timed
+def get_user_sessions_version(user_id: int) -> str:
+    """Changes whenever the user's session list changes; used for ETags."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT MAX(updated_at), COUNT(*) FROM sessions WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+    return f"{row[0]}:{row[1]}"
+
+@_timed
+def save_message(session_id: str, role: str, content: str, english_meaning: str = None,
+                 degradation_level: int = None) -> int:
+    with connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            """INSERT INTO messages (session_id, role, content, english_meaning, degradation_level)
+               VALUES (?, ?, ?, ?, ?)""",
+            (session_id, role, content, english_meaning, degradation_level)
+        )
+        message_id = cursor.lastrowid
+        
+        cursor.execute(
+            "UPDATE sessions SET updated_at = ?, first_message = COALESCE(first_message, ?) WHERE id = ?",
+            (utc_timestamp(), content, session_id)
+        )
+        
+        conn.commit()
     return message_id
 
+@_timed
 def get_session_messages(session_id: str) -> list[dict]:
-    conn = get_connection()
-    cursor = conn.cursor()
+    with connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            "SELECT role, content, english_meaning FROM messages WHERE session_id = ? ORDER BY created_at, id",
+            (session_id,)
+        )
+        
+        messages = [dict(row) for row in cursor.fetchall()]
+    return messages
+
+@_timed
+def get_recent_messages(session_id: str, limit: int) -> list[dict]:
+    """Return the last `limit` messages of a session, oldest first."""
+    with connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            """SELECT role, content, english_meaning FROM messages WHERE session_id = ?
+               ORDER BY created_at DESC, id DESC LIMIT ?""",
+            (session_id, limit)
+        )
+        
+        messages = [dict(row) for row in cursor.fetchall()]
+    messages.reverse()
+    return messages
+
+@_timed
+def get_session_messages_page(session_id: str, limit: int = None, cursor: str = None) -> tuple[list[dict], str | None]:
+    """Messages oldest first, keyset-paginated on (created_at, id)."""
+    query = """SELECT id, role, content, english_meaning, created_at
+               FROM messages WHERE session_id = ?"""
+    params = [session_id]
+    if cursor:
+        query += " AND (created_at, id) > (?, ?)"
+        params.extend(decode_cursor(cursor))
+    query += " ORDER BY created_at, id"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit + 1)
     
-    cursor.execute(
-        "SELECT role, content, english_meaning FROM messages WHERE session_id = ? ORDER BY created_at",
-        (session_id,)
-    )
+    with connection() as conn:
+        messages = [dict(row) for row in conn.execute(query, params).fetchall()]
     
-    messages = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return messages
+    next_cursor = None
+    if limit and len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = encode_cursor(messages[-1]["created_at"], messages[-1]["id"])
+    return messages, next_cursor
+
+@_timed
+def get_session_version(session_id: str) -> str:
+    """Changes whenever a message is added to the session; used for ETags."""
+    with connection() as conn:
+        row = conn.execute("SELECT updated_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    return str(row["updated_at"]) if row else "missing"
+
+def to_fts_query(text: str) -> str:
+    """Quote each word so user input cannot inject FTS5 syntax; the last word matches as a prefix."""
+    words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if words:
+        words[-1] += "*"
+    return " ".join(words)
+
+@_timed
+def search_messages(query: str, user_id: int = None, role: str = None,
+                    limit: int = 20, offset: int = 0) -> list[dict]:
+    """Ranked full-text search with highlighted snippets; user_id=None searches every session."""
+    fts_query = to_fts_query(query)
+    if not fts_query:
+        return []
+    sql = """SELECT m.id AS message_id, m.session_id, m.role, m.created_at,
+                    snippet(messages_fts, 0, '<mark>', '</mark>', '…', 16) AS snippet
+             FROM messages_fts
+             JOIN messages m ON m.id = messages_fts.rowid
+             JOIN sessions s ON s.id = m.session_id
+             WHERE messages_fts MATCH ?"""
+    params = [fts_query]
+    if user_id is not None:
+        sql += " AND s.user_id = ?"
+        params.append(user_id)
+    if role:
+        sql += " AND m.role = ?"
+        params.append(role)
+    sql += " ORDER BY rank LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+    
+    with connection() as conn:
+        return [dict(row) for row in conn.execute(sql, params).fetchall()]
 
+@_timed
 def delete_session(session_id: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
-    cursor.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
-    conn.commit()
-    conn.close()
-
-def save_feedback(message_id: int, rating: int, comment: str = None):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO feedback (message_id, rating, comment) VALUES (?, ?, ?)",
-        (message_id, rating, comment)
-    )
-    conn.commit()
-    conn.close()
+    # Messages and their feedback go with it via ON DELETE CASCADE
+    with connection() as conn:
+        conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        conn.commit()
+
+@_timed
+def save_feedback(message_id: int, rating: int, comment: str = None) -> bool:
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT INTO feedback (message_id, rating, comment) VALUES (?, ?, ?)",
+                (message_id, rating, comment)
+            )
+        except sqlite3.IntegrityError:
+            return False
+        conn.commit()
+    return True
+
+@_timed
+def get_max_message_id() -> int:
+    """Highest message id ever allocated, including deleted rows."""
+    with connection() as conn:
+        row = conn.execute(
+            """SELECT MAX(
+                   COALESCE((SELECT MAX(id) FROM messages), 0),
+                   COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'messages'), 0)
+               )"""
+        ).fetchone()
+    return row[0]
+
+@_timed
+def save_batch(messages: list[dict], feedback: list[dict]):
+    """Write pre-numbered messages and feedback in a single transaction."""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            """INSERT INTO messages (id, session_id, role, content, english_meaning, degradation_level, created_at)
+               VALUES (:id, :session_id, :role, :content, :english_meaning, :degradation_level, :created_at)""",
+            messages
+        )
+        cursor.executemany(
+            """UPDATE sessions SET updated_at = :updated_at, first_message = COALESCE(first_message, :content)
+               WHERE id = :session_id""",
+            messages
+        )
+        cursor.executemany(
+            "INSERT INTO feedback (message_id, rating, comment) VALUES (:message_id, :rating, :comment)",
+            feedback
+        )
+        conn.commit()
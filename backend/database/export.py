@@ -0,0 +1,80 @@
+"""Streaming export of messages with their feedback, for evaluation and fine-tuning.
+
+Rows are read through a dedicated connection in fixed-size batches and
+written out as gzip-compressed NDJSON, so memory stays flat however many
+rows are exported.
+"""
+
+import json
+import zlib
+from datetime import datetime
+from typing import Iterator
+
+from database.db import get_connection
+
+FETCH_BATCH_SIZE = 1000
+
+EXPORT_QUERY = """
+    SELECT m.id, m.session_id, s.user_id, m.role, m.content, m.english_meaning, m.degradation_level, m.created_at,
+           (SELECT json_group_array(json_object('rating', f.rating, 'comment', f.comment, 'created_at', f.created_at))
+            FROM feedback f WHERE f.message_id = m.id) AS feedback
+    FROM messages m LEFT JOIN sessions s ON s.id = m.session_id
+"""
+
+def iter_messages(
+    since: datetime = None,
+    until: datetime = None,
+    min_rating: int = None,
+    max_rating: int = None
+) -> Iterator[dict]:
+    """Yield exported messages in id order. Rating filters keep only messages with matching feedback."""
+    conditions, params = [], []
+    if since:
+        conditions.append("m.created_at >= ?")
+        params.append(since.strftime("%Y-%m-%d %H:%M:%S"))
+    if until:
+        conditions.append("m.created_at < ?")
+        params.append(until.strftime("%Y-%m-%d %H:%M:%S"))
+    if min_rating is not None or max_rating is not None:
+        conditions.append(
+            "EXISTS (SELECT 1 FROM feedback f WHERE f.message_id = m.id AND f.rating BETWEEN ? AND ?)"
+        )
+        params.extend([
+            min_rating if min_rating is not None else -2**63,
+            max_rating if max_rating is not None else 2**63 - 1
+        ])
+    query = EXPORT_QUERY
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY m.id"
+
+    # Own connection: a long read must not hold a pooled one; WAL keeps writers unblocked
+    conn = get_connection()
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                item = dict(row)
+                item["feedback"] = json.loads(item["feedback"])
+                yield item
+    finally:
+        conn.close()
+
+def iter_ndjson_gzip(rows: Iterator[dict], chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Encode rows as NDJSON and gzip them incrementally."""
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    buffer = []
+    buffered = 0
+    for row in rows:
+        line = (json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8")
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= chunk_size:
+            data = compressor.compress(b"".join(buffer))
+            buffer, buffered = [], 0
+            if data:
+                yield data
+    yield compressor.compress(b"".join(buffer)) + compressor.flush()
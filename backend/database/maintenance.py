@@ -0,0 +1,113 @@
+"""Background retention and compaction.
+
+Sessions idle for longer than the retention window are archived to
+gzip-compressed JSONL files in ARCHIVE_DIR and then deleted (messages and
+feedback cascade). Each run finishes with an incremental vacuum and
+ANALYZE so the hot database stays small and query plans stay fresh.
+"""
+
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from database.db import connection, utc_timestamp
+from src.config import ARCHIVE_DIR, RETENTION_DAYS, MAINTENANCE_INTERVAL_HOURS
+
+ARCHIVE_BATCH_SIZE = 500  # Sessions per archive file / delete transaction
+VACUUM_PAGES = 2000  # Free pages released per incremental vacuum step
+
+def archive_old_sessions(retention_days: int = RETENTION_DAYS, on_archived=None) -> int:
+    """Move sessions idle for more than retention_days to cold storage. Returns sessions archived.
+
+    on_archived(session_ids) is called after each deleted batch, e.g. to drop in-memory state.
+    """
+    cutoff = utc_timestamp(datetime.now(timezone.utc) - timedelta(days=retention_days))
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    archived = 0
+
+    while True:
+        with connection() as conn:
+            sessions = [dict(row) for row in conn.execute(
+                "SELECT * FROM sessions WHERE updated_at < ? ORDER BY updated_at LIMIT ?",
+                (cutoff, ARCHIVE_BATCH_SIZE)
+            )]
+            if not sessions:
+                return archived
+
+            archive_path = ARCHIVE_DIR / f"sessions-{datetime.now():%Y%m%d-%H%M%S-%f}.jsonl.gz"
+            with gzip.open(archive_path, "wt", encoding="utf-8") as f:
+                for session in sessions:
+                    messages = [dict(row) for row in conn.execute(
+                        "SELECT * FROM messages WHERE session_id = ? ORDER BY created_at, id",
+                        (session["id"],)
+                    )]
+                    for message in messages:
+                        message["feedback"] = [dict(row) for row in conn.execute(
+                            "SELECT rating, comment, created_at FROM feedback WHERE message_id = ?",
+                            (message["id"],)
+                        )]
+                    session["messages"] = messages
+                    f.write(json.dumps(session, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+            # Only delete once the archive is durably on disk
+            conn.executemany(
+                "DELETE FROM sessions WHERE id = ?",
+                [(session["id"],) for session in sessions]
+            )
+            conn.commit()
+            archived += len(sessions)
+            if on_archived is not None:
+                on_archived([session["id"] for session in sessions])
+
+def compact():
+    """Release free pages back to the filesystem and refresh planner statistics."""
+    with connection() as conn:
+        conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})").fetchall()
+        conn.execute("ANALYZE")
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+def run_maintenance(on_archived=None) -> dict:
+    """One full maintenance pass."""
+    archived = archive_old_sessions(on_archived=on_archived) if RETENTION_DAYS > 0 else 0
+    compact()
+    return {"archived_sessions": archived}
+
+class MaintenanceScheduler:
+    """Runs run_maintenance() every MAINTENANCE_INTERVAL_HOURS on a daemon thread."""
+
+    def __init__(self, interval_hours: float = MAINTENANCE_INTERVAL_HOURS):
+        self.interval = interval_hours * 3600
+        self._stop = threading.Event()
+        self._thread = None
+        self._on_archived = None
+
+    def start(self, on_archived=None):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._on_archived = on_archived
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                result = run_maintenance(self._on_archived)
+                print(f"DB maintenance done: {result}")
+            except Exception as e:
+                print(f"DB maintenance error: {e}")
+
+# Shared instance
+maintenance_scheduler = MaintenanceScheduler()
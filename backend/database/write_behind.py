@@ -0,0 +1,153 @@
+"""Write-behind persistence for chat messages and feedback.
+
+Writes are queued and group-committed by a background thread, so the chat
+request path never waits on a SQLite commit. Message ids are allocated up
+front from an in-process counter, which assumes a single API process owns
+the database. Feedback is only queued while its message is itself still
+queued; otherwise it is written synchronously so unknown ids are reported.
+"""
+
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from database import db
+from src.config import WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_MS
+
+_STOP = object()
+
+class WriteBehindQueue:
+    def __init__(self, batch_size: int = WRITE_BEHIND_BATCH_SIZE, flush_ms: int = WRITE_BEHIND_FLUSH_MS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self._queue: queue.Queue = queue.Queue()
+        self._id_lock = threading.Lock()
+        self._next_message_id = None
+        self._pending_ids: set[int] = set()  # Queued messages not yet committed (guarded by _id_lock)
+        self._thread = None
+
+    def start(self):
+        """Seed the id counter from the database and start the writer thread."""
+        if self._thread is not None:
+            return
+        self._next_message_id = db.get_max_message_id() + 1
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flush everything still queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def flush(self):
+        """Block until every write queued before this call has been committed.
+
+        Waits on a per-call barrier rather than queue.join(), so steady writes
+        from other sessions can't keep the caller waiting.
+        """
+        if self._thread is not None:
+            done = threading.Event()
+            self._queue.put(("barrier", done))
+            done.wait()
+
+    def save_message(self, session_id: str, role: str, content: str, english_meaning: str = None,
+                     degradation_level: int = None) -> int:
+        """Queue a message and return the id it will be stored under."""
+        with self._id_lock:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+            self._pending_ids.add(message_id)
+        self._queue.put(("message", {
+            "id": message_id,
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "english_meaning": english_meaning,
+            "degradation_level": degradation_level,
+            # Same format as CURRENT_TIMESTAMP, taken at enqueue time
+            "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+            "updated_at": db.utc_timestamp(),
+        }))
+        return message_id
+
+    def save_feedback(self, message_id: int, rating: int, comment: str = None) -> bool:
+        """Queue feedback on a still-queued message; otherwise write it now (False if the id is unknown)."""
+        with self._id_lock:
+            queued = message_id in self._pending_ids
+            if queued:
+                # Enqueued under the lock so the message can't be committed and forgotten in between
+                self._queue.put(("feedback", {
+                    "message_id": message_id,
+                    "rating": rating,
+                    "comment": comment,
+                }))
+        if queued:
+            return True
+        return db.save_feedback(message_id, rating, comment)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            batch = [first]
+            if first is _STOP:
+                stopping = True
+            else:
+                # Gather until the batch is full or the oldest write is due
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    batch.append(item)
+                    if item is _STOP:
+                        stopping = True
+                        break
+            # Drain whatever arrived before the stop marker
+            if stopping:
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+            items = [item for item in batch if item is not _STOP]
+            self._write([item for item in items if item[0] != "barrier"])
+            with self._id_lock:
+                for kind, row in items:
+                    if kind == "message":
+                        self._pending_ids.discard(row["id"])
+            for kind, done in items:
+                if kind == "barrier":
+                    done.set()
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, items: list[tuple]):
+        if not items:
+            return
+        messages = [row for kind, row in items if kind == "message"]
+        feedback = [row for kind, row in items if kind == "feedback"]
+        try:
+            db.save_batch(messages, feedback)
+        except Exception as e:
+            print(f"Write-behind batch error: {e}; retrying rows individually")
+            # Isolate the bad row so the rest of the batch is not lost
+            for kind, row in items:
+                try:
+                    if kind == "message":
+                        db.save_batch([row], [])
+                    else:
+                        db.save_batch([], [row])
+                except Exception as row_error:
+                    print(f"Write-behind dropped {kind} row: {row_error}")
+
+# Shared instance
+write_behind = WriteBehindQueue()
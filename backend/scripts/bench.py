@@ -0,0 +1,358 @@
+"""Micro-benchmarks for the CPU-bound hot paths, with JSON results and regression checks.
+
+Suites:
+  retriever  Retriever.retrieve over synthetic corpora (query embedding excluded)
+  embedding  EmbeddingService.embed vs embed_batch at several batch sizes
+  context    ContextManager operations with the history window full
+  db         every public database/db.py function against a pre-populated DB
+
+    python scripts/bench.py run --output bench.json
+    python scripts/bench.py run --suite db --suite context --compare bench.json
+    python scripts/bench.py compare baseline.json bench.json --tolerance 0.15
+"""
+
+import gc
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+SUITES = ("retriever", "embedding", "context", "db")
+
+# Synthetic vocabulary large enough that FTS terms are selective, as in real chat text
+SYLLABLES = ("ka", "ghar", "ma", "pa", "ni", "bhai", "di", "ra", "to", "gau", "chh", "lo", "hu", "ne", "sa")
+VOCABULARY = sorted({a + b + c for a in SYLLABLES for b in SYLLABLES for c in ("", *SYLLABLES[:6])})
+
+def sentence(rng: random.Random, words: int = 8) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+def measure(fn, min_time: float, repeat: int) -> dict:
+    """Time fn() like timeit: calibrate a loop count to ~min_time, then take `repeat` rounds.
+
+    fn receives a running call index so it can vary its input.
+    """
+    counter = iter(range(1 << 62))
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn(next(counter))
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    rounds = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn(next(counter))
+            rounds.append((time.perf_counter() - start) / number * 1e6)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return {
+        "median_us": statistics.median(rounds),
+        "min_us": min(rounds),
+        "stdev_us": statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+        "loops": number,
+        "repeat": repeat,
+    }
+
+# ---------------------------------------------------------------------------
+# Suites: each yields (name, callable) pairs; setup cost stays outside measure()
+# ---------------------------------------------------------------------------
+
+def bench_retriever(args):
+    from src import retriever as retriever_module
+    from src.config import EMBEDDING_DIM, TOP_K_RESULTS
+
+    class FixedEmbedding:
+        """Precomputed query vector, so only the similarity search is timed."""
+        def __init__(self, vector):
+            self.vector = vector
+
+        def embed(self, text):
+            return self.vector
+
+    rng = np.random.default_rng(args.seed)
+    original = retriever_module.embedding_service
+    try:
+        for size in args.retriever_sizes:
+            r = retriever_module.Retriever.__new__(retriever_module.Retriever)
+            r.embeddings = rng.standard_normal((size, EMBEDDING_DIM), dtype=np.float32)
+            r.english_sentences = [f"english {i}" for i in range(size)]
+            r.kumaoni_sentences = [f"kumaoni {i}" for i in range(size)]
+            retriever_module.embedding_service = FixedEmbedding(
+                rng.standard_normal(EMBEDDING_DIM, dtype=np.float32)
+            )
+            yield f"retriever.retrieve[n={size}]", lambda i, r=r: r.retrieve("query", TOP_K_RESULTS)
+            del r
+    finally:
+        retriever_module.embedding_service = original
+
+def bench_embedding(args):
+    from utils.embedding_service import embedding_service
+
+    rng = random.Random(args.seed)
+    texts = [sentence(rng) for _ in range(max(args.batch_sizes))]
+    embedding_service.embed(texts[0])  # first call pays model warm-up
+
+    yield "embedding.embed", lambda i: embedding_service.embed(texts[i % len(texts)])
+    for size in args.batch_sizes:
+        batch = texts[:size]
+        # Reported per call; divide by batch size for per-text cost (see "per_item_us")
+        yield f"embedding.embed_batch[batch={size}]", lambda i, batch=batch: embedding_service.embed_batch(batch)
+
+def bench_context(args):
+    from src.context_manager import ContextManager
+    from src.config import MAX_HISTORY_TURNS
+
+    rng = random.Random(args.seed)
+    texts = [sentence(rng, 20) for _ in range(256)]
+    cm = ContextManager()
+    for i in range(MAX_HISTORY_TURNS * 2):
+        cm.add_message("user" if i % 2 == 0 else "assistant", texts[i % len(texts)])
+    stored = [{"role": m.role, "content": m.content} for m in cm.get_history()] * 4
+
+    yield "context.add_message[full]", lambda i: cm.add_message("user", texts[i & 255])
+    yield "context.get_recent[6]", lambda i: cm.get_recent(6)
+    yield "context.get_history", lambda i: cm.get_history()
+    yield "context.load_messages", lambda i: ContextManager().load_messages(stored)
+
+def populate(db, users: int, sessions_per_user: int, messages_per_session: int, seed: int) -> dict:
+    """Bulk-insert a realistic dataset directly, bypassing the per-row API."""
+    rng = random.Random(seed)
+    with db.connection() as conn:
+        conn.executemany(
+            "INSERT INTO users (id, email, password_hash, name) VALUES (?, ?, ?, ?)",
+            [(u, f"user{u}@example.com", db.hash_password("secret"), f"User {u}") for u in range(1, users + 1)]
+        )
+        session_rows, message_rows = [], []
+        message_id = 0
+        for u in range(1, users + 1):
+            for s in range(sessions_per_user):
+                session_id = f"s-{u}-{s}"
+                day = f"2024-01-{1 + s % 28:02d}"
+                session_rows.append((session_id, u, f"Chat {s}", f"{day} 10:00:00", f"{day} 11:00:00"))
+                for m in range(messages_per_session):
+                    message_id += 1
+                    message_rows.append((
+                        message_id, session_id, "user" if m % 2 == 0 else "assistant",
+                        sentence(rng, 12), sentence(rng, 12), f"{day} 10:{m // 60:02d}:{m % 60:02d}"
+                    ))
+        conn.executemany(
+            "INSERT INTO sessions (id, user_id, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            session_rows
+        )
+        conn.executemany(
+            """INSERT INTO messages (id, session_id, role, content, english_meaning, created_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            message_rows
+        )
+        conn.execute("UPDATE sessions SET first_message = (SELECT content FROM messages m "
+                     "WHERE m.session_id = sessions.id ORDER BY m.id LIMIT 1)")
+        conn.commit()
+        conn.execute("ANALYZE")
+    return {"users": users, "sessions": len(session_rows), "messages": message_id}
+
+def bench_db(args):
+    from database import db
+
+    tmp = tempfile.TemporaryDirectory()
+    try:
+        db.DATABASE_PATH = Path(tmp.name) / "bench.db"
+        db.init_db()
+        sizes = populate(db, args.db_users, args.db_sessions, args.db_messages, args.seed)
+        print(f"  populated {sizes}", file=sys.stderr)
+
+        # Reads target a fixed user/session; writes go to a scratch user so they don't skew the reads
+        user_id = args.db_users // 2
+        scratch = db.create_user(f"scratch-{time.time_ns()}@example.com", "secret", "Scratch")["id"]
+        db.create_session("scratch", scratch)
+        sessions = [f"s-{u}-{s}" for u in range(1, args.db_users + 1) for s in range(args.db_sessions)]
+        session_id = sessions[len(sessions) // 2]
+        _, sessions_cursor = db.get_user_sessions_page(user_id, 10)
+        _, messages_cursor = db.get_session_messages_page(session_id, 10)
+        max_id = db.get_max_message_id()
+        run_id = time.time_ns()
+
+        def delete_session(i):
+            db.create_session(f"del-{run_id}-{i}", scratch)
+            db.delete_session(f"del-{run_id}-{i}")
+
+        def delete_user(i):
+            user = db.create_user(f"del-{run_id}-{i}@example.com", "secret", "Temp")
+            db.delete_user(user["id"])
+
+        yield "db.create_user", lambda i: db.create_user(f"new-{run_id}-{i}@example.com", "secret", "New")
+        yield "db.authenticate_user", lambda i: db.authenticate_user(f"user{user_id}@example.com", "secret")
+        yield "db.get_user_by_id[cached]", lambda i: db.get_user_by_id(user_id)
+        yield "db.get_user_by_id[uncached]", lambda i: (db._invalidate_user(user_id), db.get_user_by_id(user_id))
+        yield "db.update_user", lambda i: db.update_user(scratch, name=f"User {i}")
+        yield "db.create_session", lambda i: db.create_session(f"new-{run_id}-{i}", scratch)
+        yield "db.update_session_title", lambda i: db.update_session_title("scratch", f"Title {i}")
+        yield "db.get_user_sessions", lambda i: db.get_user_sessions(user_id)
+        yield "db.get_user_sessions_page[first]", lambda i: db.get_user_sessions_page(user_id, 20)
+        yield "db.get_user_sessions_page[cursor]", lambda i: db.get_user_sessions_page(user_id, 20, sessions_cursor)
+        yield "db.get_user_sessions_version", lambda i: db.get_user_sessions_version(user_id)
+        yield "db.save_message", lambda i: db.save_message("scratch", "user", f"message {i}", "meaning")
+        yield "db.get_session_messages", lambda i: db.get_session_messages(sessions[i % len(sessions)])
+        yield "db.get_recent_messages", lambda i: db.get_recent_messages(sessions[i % len(sessions)], 20)
+        yield "db.get_session_messages_page[first]", lambda i: db.get_session_messages_page(session_id, 50)
+        yield "db.get_session_messages_page[cursor]", lambda i: db.get_session_messages_page(session_id, 50, messages_cursor)
+        yield "db.get_session_version", lambda i: db.get_session_version(session_id)
+        terms = VOCABULARY[::7]
+        yield "db.search_messages", lambda i: db.search_messages(terms[i % len(terms)], limit=20)
+        yield "db.search_messages[user]", lambda i: db.search_messages(terms[i % len(terms)], user_id=user_id, limit=20)
+        yield "db.save_feedback", lambda i: db.save_feedback(1 + i % max_id, 1, None)
+        yield "db.get_max_message_id", lambda i: db.get_max_message_id()
+        yield "db.delete_session", delete_session
+        yield "db.delete_user", delete_user
+    finally:
+        db.close_pool()
+        tmp.cleanup()
+
+SUITE_FUNCTIONS = {
+    "retriever": bench_retriever,
+    "embedding": bench_embedding,
+    "context": bench_context,
+    "db": bench_db,
+}
+
+# ---------------------------------------------------------------------------
+# Results
+# ---------------------------------------------------------------------------
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).parent, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+    }
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list[dict]:
+    """Rows for benchmarks present in both runs; a regression is a median slower by more than tolerance."""
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result["median_us"] / base["median_us"] if base["median_us"] else float("inf")
+        rows.append({
+            "name": name,
+            "baseline_us": base["median_us"],
+            "current_us": result["median_us"],
+            "ratio": ratio,
+            "regression": ratio > 1 + tolerance,
+        })
+    return rows
+
+def print_comparison(rows: list[dict], tolerance: float) -> int:
+    print(f"\n{'benchmark':<44}{'baseline (us)':>15}{'current (us)':>15}{'change':>10}")
+    regressions = 0
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        regressions += row["regression"]
+        print(f"{row['name']:<44}{row['baseline_us']:>15.1f}{row['current_us']:>15.1f}"
+              f"{(row['ratio'] - 1) * 100:>+9.1f}%{flag}")
+    print(f"\n{regressions} regression(s) beyond {tolerance:.0%}")
+    return regressions
+
+def load_results(path: Path) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def run(args) -> int:
+    selected = args.suite or list(SUITES)
+    results = {}
+    print(f"{'benchmark':<44}{'median (us)':>14}{'min (us)':>12}{'loops':>9}")
+    for suite in selected:
+        print(f"[{suite}]", file=sys.stderr)
+        try:
+            for name, fn in SUITE_FUNCTIONS[suite](args):
+                if args.filter and args.filter not in name:
+                    continue
+                result = measure(fn, args.min_time, args.repeat)
+                batch = name.partition("[batch=")[2].rstrip("]")
+                if batch:
+                    result["per_item_us"] = result["median_us"] / int(batch)
+                results[name] = result
+                print(f"{name:<44}{result['median_us']:>14.1f}{result['min_us']:>12.1f}{result['loops']:>9}")
+        except ImportError as e:
+            print(f"  skipped {suite}: {e}", file=sys.stderr)
+
+    report = {"meta": metadata(), "config": {
+        "min_time": args.min_time, "repeat": args.repeat, "seed": args.seed,
+        "retriever_sizes": args.retriever_sizes, "batch_sizes": args.batch_sizes,
+        "db": {"users": args.db_users, "sessions": args.db_sessions, "messages": args.db_messages},
+    }, "results": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nSaved {len(results)} results to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        rows = compare(load_results(args.compare), report, args.tolerance)
+        return 1 if print_comparison(rows, args.tolerance) else 0
+    return 0
+
+def int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmarks")
+    run_parser.add_argument("--suite", action="append", choices=SUITES, help="Suite to run (repeatable; default all)")
+    run_parser.add_argument("-k", "--filter", help="Only benchmarks whose name contains this")
+    run_parser.add_argument("-o", "--output", type=Path, help="Write results as JSON")
+    run_parser.add_argument("--compare", type=Path, help="Baseline JSON to compare against")
+    run_parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown before flagging")
+    run_parser.add_argument("--min-time", type=float, default=0.2, help="Seconds per measurement round")
+    run_parser.add_argument("--repeat", type=int, default=5, help="Measurement rounds per benchmark")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--retriever-sizes", type=int_list, default=[10_000, 100_000, 1_000_000])
+    run_parser.add_argument("--batch-sizes", type=int_list, default=[1, 8, 32, 128])
+    run_parser.add_argument("--db-users", type=int, default=100)
+    run_parser.add_argument("--db-sessions", type=int, default=20, help="Sessions per user")
+    run_parser.add_argument("--db-messages", type=int, default=40, help="Messages per session")
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("current", type=Path)
+    compare_parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown before flagging")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        rows = compare(load_results(args.baseline), load_results(args.current), args.tolerance)
+        sys.exit(1 if print_comparison(rows, args.tolerance) else 0)
+    sys.exit(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Micro-benchmark: per-operation DB latency, the original database code vs the current one.
+
+"before" re-creates the original schema (no secondary indexes, no
+migrations) and runs the original queries on a fresh rollback-journal
+connection per call, with no user cache. "after" is database/db.py as it
+is now. Each run uses its own file, and the user cache is cleared before
+the "after" run so no state carries over.
+"""
+
+import sys
+import time
+import sqlite3
+import tempfile
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import db
+
+class LegacyDB:
+    """The original database/db.py code paths the benchmark compares against."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def get_connection(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self):
+        conn = self.get_connection()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                email TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                name TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                title TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                english_meaning TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (session_id) REFERENCES sessions(id)
+            );
+        """)
+        conn.commit()
+        conn.close()
+
+    def create_user(self, email: str, password: str, name: str) -> dict:
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO users (email, password_hash, name) VALUES (?, ?, ?)",
+            (email.lower(), db.hash_password(password), name)
+        )
+        conn.commit()
+        conn.close()
+        return {"id": cursor.lastrowid, "email": email, "name": name}
+
+    def create_session(self, session_id: str, user_id: int = None):
+        conn = self.get_connection()
+        conn.execute("INSERT OR IGNORE INTO sessions (id, user_id) VALUES (?, ?)", (session_id, user_id))
+        conn.commit()
+        conn.close()
+
+    def save_message(self, session_id: str, role: str, content: str, english_meaning: str = None) -> int:
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO messages (session_id, role, content, english_meaning) VALUES (?, ?, ?, ?)",
+            (session_id, role, content, english_meaning)
+        )
+        cursor.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (datetime.now(), session_id))
+        message_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return message_id
+
+    def get_session_messages(self, session_id: str) -> list[dict]:
+        # The original chat turn loaded the whole history to rebuild a session's context
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT role, content, english_meaning FROM messages WHERE session_id = ? ORDER BY created_at",
+            (session_id,)
+        )
+        messages = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return messages
+
+    def get_user_by_id(self, user_id: int) -> dict:
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, email, name FROM users WHERE id = ?", (user_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return {"id": row["id"], "email": row["email"], "name": row["name"]} if row else None
+
+    def get_user_sessions(self, user_id: int) -> list:
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            """SELECT s.id, s.title, s.created_at, s.updated_at,
+               (SELECT content FROM messages WHERE session_id = s.id ORDER BY created_at LIMIT 1) as first_message
+               FROM sessions s WHERE s.user_id = ? ORDER BY s.updated_at DESC""",
+            (user_id,)
+        )
+        sessions = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return sessions
+
+def time_op(fn, iterations: int) -> float:
+    """Return mean latency of fn() in microseconds."""
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def run_before(path: Path, iterations: int) -> dict:
+    legacy = LegacyDB(path)
+    legacy.init_db()
+    user = legacy.create_user("bench@example.com", "secret", "Bench")
+    legacy.create_session("bench", user["id"])
+    return {
+        "save_message": time_op(
+            lambda i: legacy.save_message("bench", "user", f"message {i}", "meaning"), iterations
+        ),
+        "load_history": time_op(
+            lambda i: legacy.get_session_messages("bench"), iterations
+        ),
+        "get_user_by_id": time_op(
+            lambda i: legacy.get_user_by_id(user["id"]), iterations
+        ),
+        "get_user_sessions": time_op(
+            lambda i: legacy.get_user_sessions(user["id"]), iterations
+        ),
+    }
+
+def run_after(path: Path, iterations: int) -> tuple[dict, float]:
+    db.DATABASE_PATH = path
+    db._user_cache.clear()
+    db.init_db()
+    user = db.create_user("bench@example.com", "secret", "Bench")
+    db.create_session("bench", user["id"])
+
+    def uncached_user(i):
+        db._user_cache.clear()
+        return db.get_user_by_id(user["id"])
+
+    results = {
+        "save_message": time_op(
+            lambda i: db.save_message("bench", "user", f"message {i}", "meaning"), iterations
+        ),
+        "load_history": time_op(
+            lambda i: db.get_recent_messages("bench", 20), iterations
+        ),
+        "get_user_by_id": time_op(uncached_user, iterations),
+        "get_user_sessions": time_op(
+            lambda i: db.get_user_sessions(user["id"]), iterations
+        ),
+    }
+    cached = time_op(lambda i: db.get_user_by_id(user["id"]), iterations)
+    db.close_pool()
+    return results, cached
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = run_before(Path(tmp) / "before.db", args.iterations)
+        after, cached_user = run_after(Path(tmp) / "after.db", args.iterations)
+
+    print(f"{'operation':<22}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    for op in before:
+        print(f"{op:<22}{before[op]:>14.1f}{after[op]:>14.1f}{before[op] / after[op]:>9.1f}x")
+    print("\nload_history: before loads the whole session, after only the last 20 messages (as the chat turn does).")
+    print("get_user_by_id after is uncached (cache cleared per call); "
+          f"a user-cache hit takes {cached_user:.1f} us.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Export messages and feedback as gzip-compressed NDJSON (streams; constant memory)."""
+
+import sys
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database.export import iter_messages, iter_ndjson_gzip
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("output", help="Output file (.ndjson.gz), or - for stdout")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Only messages created at or after this UTC time")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Only messages created before this UTC time")
+    parser.add_argument("--min-rating", type=int, help="Only messages with feedback rated at least this")
+    parser.add_argument("--max-rating", type=int, help="Only messages with feedback rated at most this")
+    args = parser.parse_args()
+
+    rows = iter_messages(args.since, args.until, args.min_rating, args.max_rating)
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in iter_ndjson_gzip(rows):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+            print(f"Saved export to {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
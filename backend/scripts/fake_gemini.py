@@ -0,0 +1,184 @@
+"""Local stand-in for the Gemini REST API, for load tests that must not burn quota.
+
+Serves generateContent and streamGenerateContent with configurable
+latency, error rate and streaming chunking. Point the backend at it with
+GEMINI_API_ENDPOINT=http://127.0.0.1:<port>.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLIES = [
+    "Bal, mi thik chhu, tum kas chha?",
+    "Haan daju, aaj mausam bhal chho.",
+    "Humar gaun mein sab thik chhan.",
+    "Ho, mi kal aul, tum chinta ni kara.",
+    "Bhal lago tumar dagad baat kari ber.",
+]
+
+MEANINGS = [
+    "I'm doing well, how about you?",
+    "Yes brother, the weather is nice today.",
+    "Everyone in our village is fine.",
+    "Yes, I'll come tomorrow, don't worry.",
+    "It's nice talking with you.",
+]
+
+class FakeGeminiConfig:
+    def __init__(self, latency_ms: float, latency_sigma: float, error_rate: float,
+                 error_status: int, stream_chunks: int, stream_gap_ms: float, seed: int = None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_chunks = stream_chunks
+        self.stream_gap_ms = stream_gap_ms
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def sample_latency(self) -> float:
+        """Lognormal latency in seconds with the given median; sigma=0 gives a fixed delay."""
+        with self.lock:
+            if self.latency_sigma <= 0:
+                return self.latency_ms / 1000
+            return self.random.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            self.requests += 1
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+def make_reply(prompt: str) -> str:
+    """Answer in the shape each backend prompt expects."""
+    index = abs(hash(prompt)) % len(REPLIES)
+    if "MEANING:" in prompt:
+        return f"MEANING: {MEANINGS[index]}\nKUMAONI: {REPLIES[index]}"
+    if "Summarize this conversation" in prompt:
+        return "The two friends are chatting casually about their day."
+    if "Your casual English response" in prompt:
+        return MEANINGS[index]
+    return REPLIES[index]
+
+def candidate(text: str, finish: bool = True) -> dict:
+    item = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finish:
+        item["finishReason"] = "STOP"
+    return item
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: FakeGeminiConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": {"code": 400, "message": "Bad JSON", "status": "INVALID_ARGUMENT"}})
+
+        prompt = " ".join(
+            part.get("text", "")
+            for content in body.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        time.sleep(self.config.sample_latency())
+
+        if self.config.should_fail():
+            status = self.config.error_status
+            return self._send_json(status, {"error": {"code": status, "message": "Injected failure", "status": "UNAVAILABLE"}})
+
+        text = make_reply(prompt)
+        if ":streamGenerateContent" in self.path:
+            return self._stream(text)
+        if ":generateContent" in self.path:
+            return self._send_json(200, {
+                "candidates": [candidate(text)],
+                "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4},
+            })
+        self._send_json(404, {"error": {"code": 404, "message": "Unknown method", "status": "NOT_FOUND"}})
+
+    def _stream(self, text: str):
+        """Stream the reply in chunks: SSE for ?alt=sse, otherwise a JSON array (what the SDK's REST transport reads)."""
+        sse = "alt=sse" in self.path
+        words = text.split(" ")
+        chunks = max(1, min(self.config.stream_chunks, len(words)))
+        size = -(-len(words) // chunks)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if sse else "application/json")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        if not sse:
+            self.wfile.write(b"[")
+        for i in range(0, len(words), size):
+            piece = " ".join(words[i:i + size]) + (" " if i + size < len(words) else "")
+            last = i + size >= len(words)
+            event = json.dumps({"candidates": [candidate(piece, finish=last)]})
+            if sse:
+                self.wfile.write(f"data: {event}\r\n\r\n".encode())
+            else:
+                self.wfile.write((event + ("]" if last else ",\n")).encode())
+            self.wfile.flush()
+            if not last:
+                time.sleep(self.config.stream_gap_ms / 1000)
+        self.close_connection = True
+
+def serve(config: FakeGeminiConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the fake server on a background thread and return it (server.server_port is the bound port)."""
+    handler = type("Handler", (FakeGeminiHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-gemini", daemon=True).start()
+    return server
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=800, help="Median response latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="Lognormal spread (0 = fixed latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected failures")
+    parser.add_argument("--stream-chunks", type=int, default=4, help="Events per streamed reply")
+    parser.add_argument("--stream-gap-ms", type=float, default=50, help="Delay between streamed events")
+    parser.add_argument("--seed", type=int, default=None)
+
+def config_from_args(args) -> FakeGeminiConfig:
+    return FakeGeminiConfig(
+        args.latency_ms, args.latency_sigma, args.error_rate, args.error_status,
+        args.stream_chunks, args.stream_gap_ms, args.seed
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8001)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = serve(config_from_args(args), port=args.port)
+    print(f"Fake Gemini listening on http://127.0.0.1:{server.server_port}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""End-to-end load test of the chat API against a local fake Gemini server.
+
+Starts fake_gemini in-process and api.py under uvicorn with a throwaway
+database and trace file, then drives /api/chat from concurrent clients.
+Each client plays whole conversations, synthetic or replayed from a JSONL
+file. Reports throughput, end-to-end and per-stage latency percentiles
+(stages come from the server's trace spans), and DB/WAL and RSS growth.
+
+The server rate-limits per user, and anonymous callers per IP, so each
+client signs up its own account; anonymous clients each connect from
+their own loopback address (127.0.x.y, Linux) to get their own key.
+429s (those per-user/session limits) and 503s (server out of capacity)
+are reported separately.
+
+    python scripts/loadtest.py --concurrency 8 --sessions 40 --turns 5
+    python scripts/loadtest.py --conversations convos.jsonl --max-p95-ms 3000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import functools
+import tempfile
+import threading
+import subprocess
+import http.client
+import http.cookiejar
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(Path(__file__).parent))
+
+import fake_gemini
+
+SYNTHETIC_MESSAGES = [
+    "Hello, how are you?",
+    "What did you eat today?",
+    "How is the weather in the village?",
+    "When are you coming home?",
+    "Tell me about your family.",
+    "I am going to the market tomorrow.",
+    "Did you sleep well?",
+    "What are you doing this evening?",
+]
+
+def percentile(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def rss_bytes(pid: int) -> int | None:
+    """Resident set size from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+def db_size(path: Path) -> dict:
+    def size(p: Path) -> int:
+        return p.stat().st_size if p.exists() else 0
+    return {"db_bytes": size(path), "wal_bytes": size(Path(f"{path}-wal"))}
+
+def load_conversations(path: Path) -> list[list[str]]:
+    """One conversation per line: {"messages": [...]} or a bare list of user messages."""
+    conversations = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            messages = item.get("messages", []) if isinstance(item, dict) else item
+            # Recorded transcripts may carry both sides; replay only the user turns
+            messages = [m["content"] if isinstance(m, dict) else m for m in messages
+                        if not isinstance(m, dict) or m.get("role", "user") == "user"]
+            if messages:
+                conversations.append(messages)
+    return conversations
+
+def loopback_address(number: int) -> str:
+    """A distinct 127.0.x.y per number, skipping 127.0.0.0 and 127.0.0.1."""
+    number += 2
+    return f"127.0.{number // 256 % 256}.{number % 256}"
+
+def can_bind(address: str) -> bool:
+    try:
+        with socket.socket() as s:
+            s.bind((address, 0))
+        return True
+    except OSError:
+        return False
+
+class SourceAddressHandler(urllib.request.HTTPHandler):
+    """Plain HTTP from a fixed local address, so the server sees a distinct client IP."""
+
+    def __init__(self, address: str):
+        super().__init__()
+        self.address = address
+
+    def http_open(self, request):
+        return self.do_open(functools.partial(http.client.HTTPConnection, source_address=(self.address, 0)), request)
+
+class Client:
+    """One simulated user with its own cookie jar (and, if given, its own source address)."""
+
+    def __init__(self, base_url: str, timeout: float, source_address: str = None):
+        self.base_url = base_url
+        self.timeout = timeout
+        handlers = [urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())]
+        if source_address is not None:
+            handlers.append(SourceAddressHandler(source_address))
+        self.opener = urllib.request.build_opener(*handlers)
+
+    def post(self, path: str, body: dict) -> tuple[int, dict]:
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, {}
+
+class LoadTest:
+    def __init__(self, args, base_url: str, conversations: list[list[str]]):
+        self.args = args
+        self.base_url = base_url
+        self.conversations = conversations
+        self.random = random.Random(args.seed)
+        self.distinct_ips = can_bind(loopback_address(0))
+        if not self.distinct_ips:
+            print("Warning: can't bind 127.0.x.y; anonymous clients share one IP and its per-user limit",
+                  file=sys.stderr)
+        self.lock = threading.Lock()
+        self.next_session = 0
+        self.latencies: list[float] = []
+        self.statuses: dict[str, int] = defaultdict(int)
+        self.degradation: dict[int, int] = defaultdict(int)
+
+    def _take_session(self) -> int | None:
+        with self.lock:
+            if self.next_session >= self.args.sessions:
+                return None
+            self.next_session += 1
+            return self.next_session
+
+    def _record(self, status: str, elapsed: float = None, level: int = None):
+        with self.lock:
+            self.statuses[status] += 1
+            if elapsed is not None:
+                self.latencies.append(elapsed)
+            if level is not None:
+                self.degradation[level] += 1
+
+    def worker(self, worker_id: int):
+        while True:
+            number = self._take_session()
+            if number is None:
+                return
+            with self.lock:
+                anonymous = self.random.random() < self.args.anonymous_fraction
+                if self.conversations:
+                    messages = self.conversations[(number - 1) % len(self.conversations)]
+                else:
+                    messages = [self.random.choice(SYNTHETIC_MESSAGES) for _ in range(self.args.turns)]
+            source = loopback_address(number) if anonymous and self.distinct_ips else None
+            client = Client(self.base_url, self.args.timeout, source)
+            if not anonymous:
+                status, _ = client.post("/api/auth/signup", {
+                    "email": f"load-{worker_id}-{number}@example.com", "password": "loadtest", "name": "Load"
+                })
+                if status != 200:
+                    self._record(f"signup_{status}")
+                    continue
+            session_id = None
+            for message in messages:
+                start = time.perf_counter()
+                try:
+                    status, body = client.post("/api/chat", {"message": message, "session_id": session_id})
+                except OSError as e:
+                    self._record(type(e).__name__)
+                    continue
+                elapsed = time.perf_counter() - start
+                if status == 200:
+                    session_id = body["session_id"]
+                    self._record("200", elapsed, body.get("degradation_level"))
+                else:
+                    self._record(str(status))
+
+def read_stage_timings(trace_file: Path) -> dict[str, list[float]]:
+    """Per-request span durations (ms) from the server's chat traces, summed per span name."""
+    stages = defaultdict(list)
+    files = sorted(trace_file.parent.glob(trace_file.name + "*"))
+    for path in files:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                trace = json.loads(line)
+                if trace.get("path") != "/api/chat" or trace.get("status") != 200:
+                    continue
+                totals = defaultdict(float)
+                for item in trace["spans"]:
+                    totals[item["name"]] += item["duration_ms"]
+                for name, total in totals.items():
+                    stages[name].append(total)
+    return stages
+
+def wait_for_health(base_url: str, process: subprocess.Popen, timeout: float) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(base_url + "/api/health", timeout=2) as response:
+                return json.loads(response.read())
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("API server did not become healthy in time")
+
+def start_server(args, workdir: Path, gemini_url: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "GEMINI_API_KEY": "loadtest",
+        "GEMINI_API_ENDPOINT": gemini_url,
+        "DATABASE_PATH": str(workdir / "chatbot.db"),
+        "ARCHIVE_DIR": str(workdir / "archive"),
+        "TRACE_FILE": str(workdir / "traces.jsonl"),
+        "PROFILE_DIR": str(workdir / "profiles"),
+        "TRACING_ENABLED": "true",
+        "MAINTENANCE_INTERVAL_HOURS": "0",
+        "SECRET_KEY": "loadtest-secret",
+    })
+    for item in args.server_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+def print_report(report: dict):
+    def ms(value):
+        return "-" if value is None else f"{value:.1f}"
+
+    print(f"\n{report['requests']} chat requests in {report['elapsed_seconds']:.1f}s "
+          f"({report['throughput_rps']:.2f} req/s, concurrency {report['concurrency']})")
+    print("Status:", ", ".join(f"{k}={v}" for k, v in sorted(report["status"].items())))
+    print(f"Rejected: {report['rejected']['429']} x 429 (per-user/session limits), "
+          f"{report['rejected']['503']} x 503 (server busy)")
+    if report["degradation_levels"]:
+        print("Degradation levels:", ", ".join(f"{k}={v}" for k, v in sorted(report["degradation_levels"].items())))
+    print(f"Fake Gemini: {report['gemini']['requests']} calls, {report['gemini']['errors']} injected errors")
+
+    print(f"\n{'stage':<28} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = [("end_to_end", report["end_to_end_ms"])] + sorted(report["stages_ms"].items())
+    for name, stats in rows:
+        print(f"{name:<28} {stats['count']:>7} {ms(stats['p50']):>9} {ms(stats['p95']):>9} {ms(stats['p99']):>9}")
+
+    before, after = report["resources"]["before"], report["resources"]["after"]
+    print()
+    for key in ("db_bytes", "wal_bytes", "rss_bytes"):
+        if before.get(key) is None or after.get(key) is None:
+            continue
+        print(f"{key:<10} {before[key] / 1024:>10.0f} KB -> {after[key] / 1024:>10.0f} KB "
+              f"({(after[key] - before[key]) / 1024:+.0f} KB)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8, help="Simultaneous clients")
+    parser.add_argument("--sessions", type=int, default=32, help="Conversations to play in total")
+    parser.add_argument("--turns", type=int, default=5, help="Messages per synthetic conversation")
+    parser.add_argument("--conversations", type=Path, help="JSONL of recorded conversations to replay instead")
+    parser.add_argument("--anonymous-fraction", type=float, default=0.2, help="Share of sessions without an account")
+    parser.add_argument("--timeout", type=float, default=60, help="Client timeout per request, seconds")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the API server, e.g. WRITE_BEHIND_ENABLED=true")
+    parser.add_argument("--keep", action="store_true", help="Keep the temp DB and traces for inspection")
+    parser.add_argument("--json", type=Path, help="Also write the report as JSON")
+    parser.add_argument("--max-p95-ms", type=float, help="Exit non-zero if end-to-end p95 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, help="Exit non-zero if the non-200 share exceeds this")
+    fake_gemini.add_arguments(parser)
+    args = parser.parse_args()
+
+    conversations = load_conversations(args.conversations) if args.conversations else []
+    if args.conversations and not conversations:
+        parser.error(f"No conversations found in {args.conversations}")
+
+    gemini_config = fake_gemini.config_from_args(args)
+    gemini_server = fake_gemini.serve(gemini_config)
+    gemini_url = f"http://127.0.0.1:{gemini_server.server_port}"
+
+    workdir = Path(tempfile.mkdtemp(prefix="chatbot-loadtest-"))
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    print(f"Fake Gemini on {gemini_url}; API on {base_url}; data in {workdir}", file=sys.stderr)
+
+    process = start_server(args, workdir, gemini_url, port)
+    try:
+        wait_for_health(base_url, process, timeout=120)
+        before = {**db_size(workdir / "chatbot.db"), "rss_bytes": rss_bytes(process.pid)}
+
+        test = LoadTest(args, base_url, conversations)
+        threads = [threading.Thread(target=test.worker, args=(i,)) for i in range(args.concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        after = {**db_size(workdir / "chatbot.db"), "rss_bytes": rss_bytes(process.pid)}
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        gemini_server.shutdown()
+
+    stages = read_stage_timings(workdir / "traces.jsonl")
+    requests = sum(v for k, v in test.statuses.items() if not k.startswith("signup_"))
+    report = {
+        "concurrency": args.concurrency,
+        "sessions": args.sessions,
+        "requests": requests,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": test.statuses.get("200", 0) / elapsed if elapsed else 0,
+        "status": dict(test.statuses),
+        "rejected": {code: test.statuses.get(code, 0) for code in ("429", "503")},
+        "degradation_levels": {str(k): v for k, v in test.degradation.items()},
+        "end_to_end_ms": summarize([v * 1000 for v in test.latencies]),
+        "stages_ms": {name: summarize(values) for name, values in stages.items()},
+        "resources": {"before": before, "after": after},
+        "gemini": {"requests": gemini_config.requests, "errors": gemini_config.errors},
+    }
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+    if args.keep:
+        print(f"\nKept {workdir}", file=sys.stderr)
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failed = False
+    p95 = report["end_to_end_ms"]["p95"]
+    if args.max_p95_ms is not None and (p95 is None or p95 > args.max_p95_ms):
+        print(f"FAIL: end-to-end p95 {p95} ms exceeds {args.max_p95_ms} ms", file=sys.stderr)
+        failed = True
+    error_rate = 1 - test.statuses.get("200", 0) / requests if requests else 1
+    if args.max_error_rate is not None and error_rate > args.max_error_rate:
+        print(f"FAIL: error rate {error_rate:.1%} exceeds {args.max_error_rate:.1%}", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""Run one database retention/compaction pass (normally done by the API's background job)."""
+
+import sys
+import argparse
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import RETENTION_DAYS
+from database.db import init_db
+from database.maintenance import archive_old_sessions, compact
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS,
+                        help="Archive sessions idle this many days (0 skips archiving)")
+    args = parser.parse_args()
+
+    init_db()
+    if args.retention_days > 0:
+        archived = archive_old_sessions(args.retention_days)
+        print(f"Archived {archived} sessions")
+    compact()
+    print("Vacuum and ANALYZE complete")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,25 @@
+import time
+from contextlib import contextmanager
 from src.normalizer import normalizer
 from src.retriever import retriever
 from src.context_manager import ContextManager
 from src.generator import generator
+from src.degradation import degradation_policy
+from utils.metrics import stage_seconds
+from utils.tracing import span, annotate
+
+@contextmanager
+def _stage(name: str, llm: bool = False):
+    """Time a pipeline stage; LLM-bound stages also feed the degradation policy."""
+    start = time.perf_counter()
+    try:
+        with span(name):
+            yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=name)
+        if llm:
+            degradation_policy.record_call_latency(elapsed)
 
 class Chatbot:
     def __init__(self):
@@ -10,32 +28,56 @@ class Chatbot:
     def chat(self, user_message: str) -> dict:
         """Process user message and return Kumaoni response."""
         
+        # Pick how much work this turn can afford under current load
+        level = degradation_policy.current()
+        annotate(degradation_level=level.level)
+        
         # Build conversation history for context awareness
         history_text = ""
         if self.context_manager.history:
             history_text = "\n".join(
                 f"{m.role.capitalize()}: {m.content}" 
-                for m in self.context_manager.history[-6:]  # Last 3 turns
+                for m in self.context_manager.get_recent(6)  # Last 3 turns
             )
         
-        # Step 1: Generate context-aware English conversational response (Stage 1)
-        english_meaning = normalizer.normalize(user_message, context=history_text)
-        
-        # Step 2: Retrieve Kumaoni examples using combined semantic query
-        # Combines original input + conversational intent for better pattern matching
-        combined_query = f"{user_message} | {english_meaning}"
-        examples = retriever.retrieve(combined_query)
-        
-        # Step 3: Get conversation summary for generation
-        context = self.context_manager.get_summary() if len(self.context_manager.history) > 2 else ""
-        
-        # Step 4: Generate Kumaoni reply
-        kumaoni_reply = generator.generate(
-            original_message=user_message,
-            english_meaning=english_meaning,
-            examples=examples,
-            context=context
-        )
+        if level.single_call:
+            # Degraded: retrieve on the raw message, then one LLM call for meaning + reply
+            with _stage("retrieve"):
+                examples = retriever.retrieve(user_message, top_k=level.top_k)[:level.max_examples]
+            with _stage("single_call", llm=True):
+                english_meaning, kumaoni_reply = generator.generate_single_call(
+                    original_message=user_message,
+                    examples=examples,
+                    context=history_text
+                )
+        else:
+            # Step 1: Generate context-aware English conversational response (Stage 1)
+            with _stage("normalize", llm=True):
+                english_meaning = normalizer.normalize(user_message, context=history_text)
+            
+            # Step 2: Retrieve Kumaoni examples using combined semantic query
+            # Combines original input + conversational intent for better pattern matching
+            combined_query = f"{user_message} | {english_meaning}"
+            with _stage("retrieve"):
+                examples = retriever.retrieve(combined_query, top_k=level.top_k)[:level.max_examples]
+            
+            # Step 3: Get conversation summary for generation (fall back to raw history when degraded)
+            if len(self.context_manager.history) <= 2:
+                context = ""
+            elif level.use_summary:
+                with _stage("summary", llm=True):
+                    context = self.context_manager.get_summary()
+            else:
+                context = history_text
+            
+            # Step 4: Generate Kumaoni reply
+            with _stage("generate", llm=True):
+                kumaoni_reply = generator.generate(
+                    original_message=user_message,
+                    english_meaning=english_meaning,
+                    examples=examples,
+                    context=context
+                )
         
         # Step 5: Update history
         self.context_manager.add_message("user", user_message)
@@ -44,7 +86,8 @@ class Chatbot:
         return {
             "reply": kumaoni_reply,
             "english_meaning": english_meaning,
-            "retrieved_examples": examples
+            "retrieved_examples": examples,
+            "degradation_level": level.level
         }
     
     def reset(self):
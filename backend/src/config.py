@@ -8,11 +8,24 @@ load_dotenv()
 BASE_DIR = Path(__file__).parent.parent
 DATA_DIR = BASE_DIR / "data"
 EMBEDDINGS_DIR = BASE_DIR / "embeddings"
-DATABASE_PATH = BASE_DIR / "database" / "chatbot.db"
+DATABASE_PATH = Path(os.getenv("DATABASE_PATH", BASE_DIR / "database" / "chatbot.db"))
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", BASE_DIR / "archive"))
+
+# Auth
+SECRET_KEY = os.getenv("SECRET_KEY", "")  # Signs session tokens
+AUTH_TOKEN_TTL_SECONDS = 86400 * 30
+USER_CACHE_TTL_SECONDS = 60
+USER_CACHE_SIZE = 1024
+
+# Admin endpoints (/api/admin/*) are disabled unless a token is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
 # Gemini API
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 GEMINI_MODEL = "gemini-2.5-flash"
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")  # Override, e.g. a local fake server
+GEMINI_TIMEOUT_SECONDS = 30
+GEMINI_MAX_RETRIES = 1  # Extra attempts on rate-limit/overload/timeout errors
 
 # Embedding
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
@@ -23,3 +36,60 @@ TOP_K_RESULTS = 30
 
 # Conversation
 MAX_HISTORY_TURNS = 10
+
+# Chat admission control
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "4"))  # Pipelines running at once
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "32"))  # Requests allowed to wait for a slot
+CHAT_QUEUE_TIMEOUT_SECONDS = 15  # Longest wait before a 503
+CHAT_MAX_PER_USER = 2  # In-flight turns per user (always 1 per session)
+
+# Adaptive degradation under load (see src/degradation.py)
+DEGRADATION_ENABLED = os.getenv("DEGRADATION_ENABLED", "true").lower() == "true"
+DEGRADE_CALL_LATENCY_TARGET_SECONDS = 3.0  # Gemini call latency considered healthy
+DEGRADE_QUEUE_TARGET = 1.0  # Queued chats per pipeline slot considered healthy
+DEGRADE_RECOVERY_SECONDS = 30  # Calm time before stepping back up one level
+
+# Database
+DB_POOL_SIZE = 8  # Idle connections kept open for reuse
+DB_MMAP_SIZE = 64 * 1024 * 1024  # Bytes of the DB file to memory-map
+DB_STATEMENT_CACHE_SIZE = 256  # Prepared statements cached per connection
+
+# Write-behind persistence (messages/feedback committed by a background writer)
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+WRITE_BEHIND_BATCH_SIZE = 64  # Commit once this many writes are queued
+WRITE_BEHIND_FLUSH_MS = 50  # ...or once the oldest queued write is this old
+
+# Retention / compaction
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))  # Archive sessions idle this long; 0 keeps everything
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv("MAINTENANCE_INTERVAL_HOURS", "24"))  # 0 disables the job
+
+# Request tracing (one JSON line per request, size-rotated)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_FILE = Path(os.getenv("TRACE_FILE", BASE_DIR / "traces" / "traces.jsonl"))
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_BACKUP_COUNT = 5
+
+# Sampling profiler for chat turns (both off by default)
+PROFILE_SAMPLE_EVERY = int(os.getenv("PROFILE_SAMPLE_EVERY", "0"))  # Profile 1 in N turns
+PROFILE_THRESHOLD_SECONDS = float(os.getenv("PROFILE_THRESHOLD_SECONDS", "0"))  # ...or any turn slower than this
+PROFILE_INTERVAL_MS = 10
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", BASE_DIR / "traces" / "profiles"))
+
+# Voice gateway (/api/voice WebSocket; needs faster-whisper, torch and edge-tts installed)
+VOICE_GATEWAY_ENABLED = os.getenv("VOICE_GATEWAY_ENABLED", "false").lower() == "true"
+VOICE_WHISPER_MODEL = os.getenv("VOICE_WHISPER_MODEL", "base")
+VOICE_WHISPER_DEVICE = os.getenv("VOICE_WHISPER_DEVICE", "cpu")
+VOICE_WHISPER_COMPUTE_TYPE = os.getenv("VOICE_WHISPER_COMPUTE_TYPE", "int8")
+VOICE_MAX_SESSIONS = int(os.getenv("VOICE_MAX_SESSIONS", "32"))  # Concurrent WebSocket connections
+VOICE_BATCH_SIZE = 8  # Utterances transcribed together in one Whisper batch
+VOICE_BATCH_WAIT_MS = 30  # How long a finished utterance waits for others to join its batch
+VOICE_BEAM_SIZE = 1
+VOICE_VAD_WORKERS = 2  # Threads scoring incoming audio for all sessions
+VOICE_VAD_THRESHOLD = 0.5
+VOICE_SILENCE_MS = 700  # Silence that ends an utterance
+VOICE_MIN_SPEECH_MS = 250  # Shorter bursts are treated as noise
+VOICE_MAX_UTTERANCE_SECONDS = 30  # One Whisper window; longer speech is cut here
+VOICE_NO_SPEECH_THRESHOLD = 0.6  # Drop transcripts Whisper thinks are silence...
+VOICE_LOG_PROB_THRESHOLD = -1.0  # ...if their average token log-prob is also below this (faster-whisper's log_prob_threshold)
+VOICE_TTS_ENABLED = True  # Stream MP3 audio of the reply after its text
+VOICE_TTS_VOICE = "hi-IN-SwaraNeural"
@@ -1,4 +1,6 @@
+from collections import deque
 from dataclasses import dataclass
+from itertools import islice
 from utils.gemini_client import gemini_client
 from src.config import MAX_HISTORY_TURNS
 
@@ -9,19 +11,26 @@ class Message:
 
 class ContextManager:
     def __init__(self):
-        self.history: list[Message] = []
+        # Fixed-size window: old messages fall off the left end on append
+        self.history: deque[Message] = deque(maxlen=MAX_HISTORY_TURNS * 2)
     
     def add_message(self, role: str, content: str):
         """Add a message to conversation history."""
         self.history.append(Message(role=role, content=content))
-        
-        # Trim old messages if limit exceeded
-        if len(self.history) > MAX_HISTORY_TURNS * 2:
-            self.history = self.history[-MAX_HISTORY_TURNS * 2:]
+    
+    def load_messages(self, messages: list[dict]):
+        """Bulk-load stored messages (oldest first), keeping only the window."""
+        self.history.extend(
+            Message(role=m["role"], content=m["content"]) for m in messages
+        )
+    
+    def get_recent(self, n: int) -> list[Message]:
+        """Return the last n messages."""
+        return list(islice(self.history, max(len(self.history) - n, 0), None))
     
     def get_history(self) -> list[Message]:
         """Return current conversation history."""
-        return self.history
+        return list(self.history)
     
     def get_summary(self) -> str:
         """Generate short English summary of conversation."""
@@ -29,7 +38,7 @@ class ContextManager:
             return ""
         
         history_text = "\n".join(
-            f"{m.role}: {m.content}" for m in self.history[-6:]
+            f"{m.role}: {m.content}" for m in self.get_recent(6)
         )
         
         prompt = f"""Summarize this conversation in 2-3 sentences in English:
@@ -41,4 +50,4 @@ Summary:"""
     
     def clear(self):
         """Clear conversation history."""
-        self.history = []
+        self.history.clear()
@@ -0,0 +1,75 @@
+import threading
+import time
+from dataclasses import dataclass
+from src.config import (
+    DEGRADATION_ENABLED, DEGRADE_CALL_LATENCY_TARGET_SECONDS, DEGRADE_QUEUE_TARGET,
+    DEGRADE_RECOVERY_SECONDS, TOP_K_RESULTS
+)
+from utils.admission import admission
+
+@dataclass(frozen=True)
+class DegradationLevel:
+    level: int
+    use_summary: bool
+    top_k: int
+    max_examples: int
+    single_call: bool
+
+# Each level keeps the cuts of the one before it
+LEVELS = [
+    DegradationLevel(0, use_summary=True, top_k=TOP_K_RESULTS, max_examples=TOP_K_RESULTS, single_call=False),
+    DegradationLevel(1, use_summary=False, top_k=TOP_K_RESULTS, max_examples=TOP_K_RESULTS, single_call=False),
+    DegradationLevel(2, use_summary=False, top_k=10, max_examples=10, single_call=False),
+    DegradationLevel(3, use_summary=False, top_k=10, max_examples=5, single_call=False),
+    DegradationLevel(4, use_summary=False, top_k=10, max_examples=5, single_call=True),
+]
+
+# Pressure (1.0 = at target) needed to enter each level
+LEVEL_THRESHOLDS = [0.0, 1.0, 1.5, 2.0, 3.0]
+
+class DegradationPolicy:
+    """Picks a degradation level from upstream latency and chat queue depth.
+
+    Steps up as soon as pressure crosses a threshold; steps back down one
+    level at a time once pressure has stayed below 80% of the current
+    level's threshold for DEGRADE_RECOVERY_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency_ewma = 0.0
+        self._level = 0
+        self._calm_since = None
+
+    def record_call_latency(self, seconds: float):
+        """Feed the duration of one upstream LLM call."""
+        with self._lock:
+            self._latency_ewma = 0.8 * self._latency_ewma + 0.2 * seconds
+
+    def pressure(self) -> float:
+        latency = self._latency_ewma / DEGRADE_CALL_LATENCY_TARGET_SECONDS
+        queue = admission.queued / admission.max_concurrent / DEGRADE_QUEUE_TARGET
+        return max(latency, queue)
+
+    def current(self) -> DegradationLevel:
+        if not DEGRADATION_ENABLED:
+            return LEVELS[0]
+        pressure = self.pressure()
+        now = time.monotonic()
+        with self._lock:
+            target = max(i for i, threshold in enumerate(LEVEL_THRESHOLDS) if pressure >= threshold)
+            if target > self._level:
+                self._level = target
+                self._calm_since = None
+            elif self._level > 0 and pressure < LEVEL_THRESHOLDS[self._level] * 0.8:
+                if self._calm_since is None:
+                    self._calm_since = now
+                elif now - self._calm_since >= DEGRADE_RECOVERY_SECONDS:
+                    self._level -= 1
+                    self._calm_since = now
+            else:
+                self._calm_since = None
+            return LEVELS[self._level]
+
+# Shared instance
+degradation_policy = DegradationPolicy()
@@ -37,6 +37,24 @@ CRITICAL RULES:
 
 Your Kumaoni response (must convey the intent meaning):"""
 
+SINGLE_CALL_PROMPT = """You are chatting casually with a friend in Kumaoni.
+
+Conversation so far:
+{context}
+
+Their latest message: "{original_message}"
+
+Reference Kumaoni patterns (use vocabulary and style from these):
+{examples}
+
+First decide what a friendly person would reply (1-2 short sentences, simple English).
+Then say exactly that in natural Roman Kumaoni (English alphabet only, no English or Hindi words,
+no emojis or formatting). Never reveal you are an AI, bot or assistant.
+
+Answer in exactly this format:
+MEANING: <your reply in English>
+KUMAONI: <the same reply in Roman Kumaoni>"""
+
 class Generator:
     def generate(
         self,
@@ -61,5 +79,32 @@ class Generator:
         )
         
         return gemini_client.generate(prompt)
+    
+    def generate_single_call(
+        self,
+        original_message: str,
+        examples: list[dict],
+        context: str = ""
+    ) -> tuple[str, str]:
+        """Produce (english_meaning, kumaoni_reply) with one LLM call; used when degraded."""
+        examples_text = "\n".join(
+            f"English: {ex['english']} → Kumaoni: {ex['kumaoni']}"
+            for ex in examples
+        )
+        
+        prompt = SINGLE_CALL_PROMPT.format(
+            context=context or "No previous conversation",
+            original_message=original_message,
+            examples=examples_text or "No examples available"
+        )
+        
+        text = gemini_client.generate(prompt)
+        english_meaning, kumaoni_reply = "", text
+        for line in text.splitlines():
+            if line.upper().startswith("MEANING:"):
+                english_meaning = line.split(":", 1)[1].strip()
+            elif line.upper().startswith("KUMAONI:"):
+                kumaoni_reply = line.split(":", 1)[1].strip()
+        return english_meaning, kumaoni_reply
 
 generator = Generator()
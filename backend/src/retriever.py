@@ -4,6 +4,7 @@ import numpy as np
 from pathlib import Path
 from src.config import DATA_DIR, EMBEDDINGS_DIR, TOP_K_RESULTS
 from utils.embedding_service import embedding_service
+from utils.metrics import stage_seconds
 
 class Retriever:
     def __init__(self):
@@ -35,7 +36,8 @@ class Retriever:
             return []
         
         # Embed query
-        query_emb = embedding_service.embed(query)
+        with stage_seconds.time(stage="embed"):
+            query_emb = embedding_service.embed(query)
         
         # Compute cosine similarity
         similarities = np.dot(self.embeddings, query_emb) / (
@@ -0,0 +1,144 @@
+import asyncio
+import contextvars
+import functools
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from utils.metrics import queue_wait_seconds, admission_rejections
+from src.config import (
+    CHAT_MAX_CONCURRENCY, CHAT_MAX_QUEUE, CHAT_QUEUE_TIMEOUT_SECONDS, CHAT_MAX_PER_USER
+)
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Bounded admission for chat pipelines.
+
+    Waiting requests are parked as coroutines on the event loop instead of
+    holding threadpool slots, and admitted pipelines run on a dedicated
+    executor, so a burst of chats cannot starve /api/health or history reads.
+    All bookkeeping happens on the event loop thread, so no locks are needed.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = CHAT_MAX_CONCURRENCY,
+        max_queue: int = CHAT_MAX_QUEUE,
+        queue_timeout: float = CHAT_QUEUE_TIMEOUT_SECONDS,
+        max_per_user: int = CHAT_MAX_PER_USER
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_per_user = max_per_user
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="chat")
+        self._user_in_flight: Counter = Counter()
+        self._session_in_flight: set[str] = set()
+        # Live metrics
+        self.queued = 0
+        self.running = 0
+        self.admitted_total = 0
+        self.rejected_total: Counter = Counter()
+        self.wait_seconds_total = 0.0
+        self.wait_count = 0
+        self.max_wait_seconds = 0.0
+        self._avg_service_seconds = 5.0  # EWMA of pipeline time, seeds Retry-After
+
+    def _retry_after(self) -> int:
+        backlog = (self.queued + self.running) / self.max_concurrent
+        return max(1, round(backlog * self._avg_service_seconds))
+
+    def _reject(self, reason: str, status_code: int, detail: str):
+        self.rejected_total[reason] += 1
+        admission_rejections.inc(reason=reason)
+        raise AdmissionRejected(status_code, detail, self._retry_after())
+
+    @asynccontextmanager
+    async def admit(self, user_key: str, session_id: str):
+        """Reserve a pipeline slot for one chat turn, or raise AdmissionRejected."""
+        if session_id in self._session_in_flight:
+            self._reject("session_busy", 429, "A reply is already in progress for this session")
+        if self._user_in_flight[user_key] >= self.max_per_user:
+            self._reject("user_limit", 429, "Too many chats in progress")
+        if self.running + self.queued >= self.max_concurrent + self.max_queue:
+            self._reject("queue_full", 503, "Server busy, please retry")
+
+        self._session_in_flight.add(session_id)
+        self._user_in_flight[user_key] += 1
+        try:
+            self.queued += 1
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject("queue_timeout", 503, "Server busy, please retry")
+            finally:
+                self.queued -= 1
+                waited = time.monotonic() - start
+                self.wait_seconds_total += waited
+                self.wait_count += 1
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+                queue_wait_seconds.observe(waited)
+
+            self.admitted_total += 1
+            self.running += 1
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                self.running -= 1
+                self._slots.release()
+                elapsed = time.monotonic() - started
+                self._avg_service_seconds = 0.8 * self._avg_service_seconds + 0.2 * elapsed
+        finally:
+            self._session_in_flight.discard(session_id)
+            self._user_in_flight[user_key] -= 1
+            if self._user_in_flight[user_key] <= 0:
+                del self._user_in_flight[user_key]
+
+    async def run(self, fn, *args, on_cancel=None):
+        """Run a blocking pipeline on the dedicated chat executor, keeping the request's contextvars.
+
+        on_cancel is called as soon as the caller is cancelled, while the
+        thread is still running, so the pipeline can skip its remaining work.
+        """
+        ctx = contextvars.copy_context()
+        future = asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(ctx.run, fn, *args))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if on_cancel is not None:
+                on_cancel()
+            # Client went away: keep holding the slot until the thread really finishes,
+            # even if the caller is cancelled again meanwhile
+            while not future.done():
+                try:
+                    await asyncio.wait([future])
+                except asyncio.CancelledError:
+                    pass
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "queued": self.queued,
+            "admitted_total": self.admitted_total,
+            "rejected_total": dict(self.rejected_total),
+            "avg_wait_seconds": self.wait_seconds_total / self.wait_count if self.wait_count else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+            "avg_service_seconds": self._avg_service_seconds,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+# Shared instance
+admission = AdmissionController()
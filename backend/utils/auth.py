@@ -0,0 +1,49 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from src.config import SECRET_KEY, AUTH_TOKEN_TTL_SECONDS
+
+if SECRET_KEY:
+    _key = SECRET_KEY.encode()
+else:
+    # Tokens will not survive a restart; set SECRET_KEY in production
+    print("SECRET_KEY not set, using a random per-process signing key")
+    _key = secrets.token_bytes(32)
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_key, payload.encode(), hashlib.sha256).digest())
+
+def create_token(user: dict, version: int = 0, ttl: int = AUTH_TOKEN_TTL_SECONDS) -> str:
+    """Signed, expiring token carrying the user's id, email, name and token version."""
+    claims = {
+        "id": user["id"], "email": user["email"], "name": user["name"],
+        "ver": version, "exp": int(time.time()) + ttl
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+def verify_token(token: str) -> dict | None:
+    """
+    Return the user claims if the token is authentic and unexpired, else None.
+    The caller still has to check "ver" against the user's current token version.
+    """
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    # Tokens from before versioning count as version 0
+    return {"id": claims["id"], "email": claims["email"], "name": claims["name"], "ver": claims.get("ver", 0)}
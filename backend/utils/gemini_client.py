@@ -1,7 +1,23 @@
+import time
 import google.generativeai as genai
-from src.config import GEMINI_API_KEY, GEMINI_MODEL
+from google.api_core import exceptions as google_exceptions
+from src.config import GEMINI_API_KEY, GEMINI_MODEL, GEMINI_MAX_RETRIES, GEMINI_API_ENDPOINT, GEMINI_TIMEOUT_SECONDS
+from utils.metrics import gemini_calls, gemini_errors, gemini_retries, prompt_chars, gemini_seconds
+from utils.tracing import span
 
-genai.configure(api_key=GEMINI_API_KEY)
+if GEMINI_API_ENDPOINT:
+    # Alternate endpoint (e.g. scripts/fake_gemini.py for load tests) over REST
+    genai.configure(api_key=GEMINI_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+else:
+    genai.configure(api_key=GEMINI_API_KEY)
+
+# Errors worth one more try: rate limiting, overload, timeouts
+TRANSIENT_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+)
 
 class GeminiClient:
     def __init__(self):
@@ -9,12 +25,27 @@ class GeminiClient:
     
     def generate(self, prompt: str) -> str:
         """Send prompt to Gemini, return response text."""
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
-        except Exception as e:
-            print(f"Gemini API Error: {e}")
-            raise e
+        prompt_chars.observe(len(prompt))
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            gemini_calls.inc()
+            try:
+                with span("gemini.generate", attempt=attempt, prompt_chars=len(prompt)), gemini_seconds.time():
+                    # SDK-level retries disabled: ours are bounded and counted
+                    response = self.model.generate_content(
+                        prompt, request_options={"timeout": GEMINI_TIMEOUT_SECONDS, "retry": None}
+                    )
+                return response.text.strip()
+            except TRANSIENT_ERRORS as e:
+                gemini_errors.inc(kind=type(e).__name__)
+                if attempt == GEMINI_MAX_RETRIES:
+                    print(f"Gemini API Error: {e}")
+                    raise e
+                gemini_retries.inc()
+                time.sleep(0.5 * 2 ** attempt)
+            except Exception as e:
+                gemini_errors.inc(kind=type(e).__name__)
+                print(f"Gemini API Error: {e}")
+                raise e
 
 # Shared instance
 gemini_client = GeminiClient()
@@ -0,0 +1,167 @@
+"""Minimal in-process metrics with Prometheus text exposition.
+
+Counters, gauges and fixed-bucket histograms guarded by one lock each;
+recording is a dict lookup plus a bisect, cheap enough to leave on in
+production. No external dependency.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond DB calls up to slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key: tuple, extra: dict = None) -> str:
+    items = list(key) + list((extra or {}).items())
+    if not items:
+        return ""
+    parts = []
+    for name, value in items:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Gauge:
+    """Either set explicitly or computed on scrape via a callback."""
+
+    def __init__(self, name: str, help_text: str, fn=None):
+        self.name = name
+        self.help = help_text
+        self._fn = fn
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if self._fn is not None:
+            lines.append(f"{self.name} {self._fn()}")
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        # key -> [per-bucket counts (+Inf last), sum, count]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# Chat pipeline
+stage_seconds = registry.register(Histogram(
+    "chatbot_stage_seconds", "Time spent in each chat pipeline stage"))
+chat_seconds = registry.register(Histogram(
+    "chatbot_chat_seconds", "End-to-end chat turn time"))
+prompt_chars = registry.register(Histogram(
+    "chatbot_prompt_chars", "Prompt size sent to Gemini, in characters", SIZE_BUCKETS))
+
+# Gemini
+gemini_seconds = registry.register(Histogram(
+    "chatbot_gemini_seconds", "Latency of individual Gemini generate calls"))
+gemini_calls = registry.register(Counter(
+    "chatbot_gemini_calls_total", "Gemini generate calls"))
+gemini_errors = registry.register(Counter(
+    "chatbot_gemini_errors_total", "Gemini calls that raised"))
+gemini_retries = registry.register(Counter(
+    "chatbot_gemini_retries_total", "Gemini calls retried after a transient error"))
+
+# Database
+db_seconds = registry.register(Histogram(
+    "chatbot_db_seconds", "Time spent in database/db.py operations"))
+
+# Admission control
+queue_wait_seconds = registry.register(Histogram(
+    "chatbot_chat_queue_wait_seconds", "Time chat requests waited for a pipeline slot"))
+admission_rejections = registry.register(Counter(
+    "chatbot_chat_rejected_total", "Chat requests shed by admission control"))
+
+# Voice gateway
+voice_stt_seconds = registry.register(Histogram(
+    "chatbot_voice_stt_seconds", "Time to transcribe one batch of utterances"))
+voice_batch_size = registry.register(Histogram(
+    "chatbot_voice_batch_size", "Utterances per Whisper batch", BATCH_BUCKETS))
+
+# Errors surfaced to clients
+errors = registry.register(Counter(
+    "chatbot_errors_total", "Unhandled errors by component"))
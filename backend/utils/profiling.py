@@ -0,0 +1,93 @@
+"""Opt-in sampling profiler for individual chat turns.
+
+One daemon thread walks the stacks of registered worker threads every
+PROFILE_INTERVAL_MS via sys._current_frames(); unregistered threads cost
+nothing. When a profiled turn ends, its samples are kept if the turn was
+picked by 1-in-N sampling or ran longer than PROFILE_THRESHOLD_SECONDS,
+and written as collapsed stacks ("frame;frame;frame count", the input
+format of flamegraph.pl and speedscope) to PROFILE_DIR/<request_id>.folded.
+"""
+
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from src.config import PROFILE_SAMPLE_EVERY, PROFILE_THRESHOLD_SECONDS, PROFILE_INTERVAL_MS, PROFILE_DIR
+
+class SamplingProfiler:
+    def __init__(
+        self,
+        sample_every: int = PROFILE_SAMPLE_EVERY,
+        threshold_seconds: float = PROFILE_THRESHOLD_SECONDS,
+        interval_ms: float = PROFILE_INTERVAL_MS
+    ):
+        self.sample_every = sample_every
+        self.threshold_seconds = threshold_seconds
+        self.interval = interval_ms / 1000
+        self.enabled = sample_every > 0 or threshold_seconds > 0
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._active: dict[int, Counter] = {}  # thread id -> collapsed stack counts
+        self._thread = None
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+
+    @contextmanager
+    def profile(self, request_id: str):
+        """Sample the calling thread for the duration of the block."""
+        if not self.enabled:
+            yield
+            return
+        picked = self.sample_every > 0 and next(self._counter) % self.sample_every == 0
+        thread_id = threading.get_ident()
+        stacks = Counter()
+        self._ensure_thread()
+        with self._lock:
+            self._active[thread_id] = stacks
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._active.pop(thread_id, None)
+            slow = self.threshold_seconds > 0 and elapsed >= self.threshold_seconds
+            if (picked or slow) and stacks:
+                self._save(request_id, stacks)
+
+    def _save(self, request_id: str, stacks: Counter):
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        path = PROFILE_DIR / f"{request_id}.folded"
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+# Shared instance
+profiler = SamplingProfiler()
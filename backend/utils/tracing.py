@@ -0,0 +1,125 @@
+"""Per-request tracing.
+
+A Trace lives in a contextvar for the duration of one HTTP request; span()
+records timed, named sections into it from anywhere below (chat stages,
+Gemini calls, DB operations). Finished traces are written as one JSON line
+each to a size-rotated local file by a background thread, so requests never
+wait on file I/O.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from src.config import TRACING_ENABLED, TRACE_FILE, TRACE_MAX_BYTES, TRACE_BACKUP_COUNT
+
+class Trace:
+    def __init__(self, request_id: str, **attrs):
+        self.request_id = request_id
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.spans: list[dict] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, duration: float, attrs: dict):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start_ms": round((start - self.start) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+                **({"attrs": attrs} if attrs else {}),
+            })
+
+    def to_dict(self, **extra) -> dict:
+        return {
+            "request_id": self.request_id,
+            "ts": time.time(),
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            **self.attrs,
+            **extra,
+            "spans": self.spans,
+        }
+
+_current: ContextVar[Trace | None] = ContextVar("trace", default=None)
+
+_logger = logging.getLogger("chatbot.trace")
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+_handler_lock = threading.Lock()
+_listener: QueueListener | None = None
+
+def _ensure_handler():
+    global _listener
+    with _handler_lock:
+        if not _logger.handlers:
+            TRACE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUP_COUNT)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            records = queue.SimpleQueue()
+            _listener = QueueListener(records, handler)
+            _listener.start()
+            _logger.addHandler(QueueHandler(records))
+
+def close_trace_writer():
+    """Write out queued traces and stop the background writer."""
+    global _listener
+    with _handler_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _logger.handlers[:]:
+            _logger.removeHandler(handler)
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+def current_request_id() -> str | None:
+    trace = _current.get()
+    return trace.request_id if trace else None
+
+def annotate(**attrs):
+    """Attach attributes to the current request's trace, if any."""
+    trace = _current.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+@contextmanager
+def trace_request(request_id: str, **attrs):
+    """Collect spans for one request; yields the Trace so callers can add final attributes."""
+    trace = Trace(request_id, **attrs)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+def write_trace(trace: Trace, **extra):
+    """Append a finished trace to the trace file (only if it recorded any spans)."""
+    if not TRACING_ENABLED or not trace.spans:
+        return
+    _ensure_handler()
+    _logger.info(json.dumps(trace.to_dict(**extra), default=str))
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a section of work under the current request's trace; no-op outside a request."""
+    trace = _current.get()
+    if trace is None or not TRACING_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        trace.add_span(name, start, time.perf_counter() - start, attrs)
@@ -0,0 +1,389 @@
+"""Server-side voice gateway.
+
+Thin clients stream 16 kHz mono PCM over a WebSocket (/api/voice); the
+server detects utterances, transcribes them, runs the normal chat
+pipeline and streams back the reply text followed by MP3 audio.
+
+Models are loaded once and shared by every connection:
+- Whisper sits behind a batching worker: utterances that finish within
+  VOICE_BATCH_WAIT_MS of each other are encoded and decoded as one
+  CTranslate2 batch (each utterance is at most one 30 s window)
+- silero-vad is recurrent, so each connection gets its own clone of the
+  checkpoint; scoring runs on a small executor shared by all connections
+
+faster-whisper, torch and edge-tts are only imported when the gateway starts.
+"""
+
+import asyncio
+import concurrent.futures
+import copy
+import json
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import suppress
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from starlette.websockets import WebSocketDisconnect
+
+from src.config import (
+    VOICE_WHISPER_MODEL, VOICE_WHISPER_DEVICE, VOICE_WHISPER_COMPUTE_TYPE,
+    VOICE_BATCH_SIZE, VOICE_BATCH_WAIT_MS, VOICE_BEAM_SIZE, VOICE_VAD_WORKERS,
+    VOICE_VAD_THRESHOLD, VOICE_SILENCE_MS, VOICE_MIN_SPEECH_MS, VOICE_MAX_UTTERANCE_SECONDS,
+    VOICE_NO_SPEECH_THRESHOLD, VOICE_LOG_PROB_THRESHOLD, VOICE_TTS_ENABLED, VOICE_TTS_VOICE
+)
+from utils.admission import AdmissionRejected
+from utils.metrics import voice_stt_seconds, voice_batch_size, errors
+
+# Wire format and model requirements, not tunables
+SAMPLE_RATE = 16000
+CHUNK_SAMPLES = 512  # silero-vad needs exactly 512 samples at 16 kHz
+CHUNK_BYTES = CHUNK_SAMPLES * 2  # pcm_s16le
+CHUNK_MS = CHUNK_SAMPLES / SAMPLE_RATE * 1000
+MAX_TEXT_TOKENS = 448  # Whisper's decoder context
+
+PREROLL_CHUNKS = 6  # Audio kept from just before speech onset (~200 ms)
+MIN_SPEECH_CHUNKS = max(1, round(VOICE_MIN_SPEECH_MS / CHUNK_MS))
+SILENCE_CHUNKS = max(1, round(VOICE_SILENCE_MS / CHUNK_MS))
+MAX_UTTERANCE_CHUNKS = int(VOICE_MAX_UTTERANCE_SECONDS * SAMPLE_RATE / CHUNK_SAMPLES)
+
+class SpeechPool:
+    """Shared Whisper + VAD for all voice connections."""
+
+    def __init__(self, batch_size: int = VOICE_BATCH_SIZE, batch_wait_ms: float = VOICE_BATCH_WAIT_MS):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.model = None
+        self._vad_template = None
+        self._vad_executor = None
+        self._queue: queue.Queue = queue.Queue()
+        self._worker = None
+        # Live metrics
+        self.sessions = 0
+        self.batches = 0
+        self.utterances = 0
+        self.max_batch = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._worker is not None
+
+    def start(self):
+        """Load the models and start the batching worker."""
+        if self._worker is not None:
+            return
+        import torch
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(VOICE_WHISPER_MODEL, device=VOICE_WHISPER_DEVICE, compute_type=VOICE_WHISPER_COMPUTE_TYPE)
+        self._vad_template, _ = torch.hub.load(repo_or_dir="snakers4/silero-vad", model="silero_vad", trust_repo=True)
+        self._vad_executor = ThreadPoolExecutor(max_workers=VOICE_VAD_WORKERS, thread_name_prefix="vad")
+        self._worker = threading.Thread(target=self._run, name="whisper-batcher", daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        if self._worker is None:
+            return
+        self._queue.put(None)
+        self._worker.join()
+        self._worker = None
+        self._vad_executor.shutdown(wait=True)
+
+    # -- VAD -----------------------------------------------------------
+
+    def new_vad(self):
+        """A per-connection VAD model; it carries recurrent state from chunk to chunk."""
+        return copy.deepcopy(self._vad_template)
+
+    def _score(self, vad, blocks: np.ndarray) -> list[float]:
+        """One forward call per chunk, in order: the model is recurrent, so they can't be batched."""
+        import torch
+        with torch.inference_mode():
+            return [vad(row, SAMPLE_RATE).item() for row in torch.from_numpy(blocks)]
+
+    async def speech_probs(self, vad, blocks: np.ndarray) -> list[float]:
+        """Score consecutive CHUNK_SAMPLES blocks (shape: chunks x CHUNK_SAMPLES) in order."""
+        return await asyncio.get_running_loop().run_in_executor(self._vad_executor, self._score, vad, blocks)
+
+    # -- Whisper -------------------------------------------------------
+
+    def supports_language(self, language: str) -> bool:
+        return language in self.model.supported_languages
+
+    async def transcribe(self, audio: np.ndarray, language: str | None = None) -> tuple[str, str | None]:
+        """Queue an utterance (float32, at most one 30 s window) and wait for (text, language)."""
+        future = concurrent.futures.Future()
+        self._queue.put((audio, language, future))
+        return await asyncio.wrap_future(future)
+
+    def _next_batch(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.0))
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # Stop after this batch
+                break
+            batch.append(item)
+        # Callers that went away (barge-in, disconnect) are dropped before any work is done
+        return [item for item in batch if item[2].set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._next_batch(first)
+            if not batch:
+                continue
+            self.batches += 1
+            self.utterances += len(batch)
+            self.max_batch = max(self.max_batch, len(batch))
+            voice_batch_size.observe(len(batch))
+            try:
+                with voice_stt_seconds.time():
+                    results = self._transcribe_batch([audio for audio, _, _ in batch], [lang for _, lang, _ in batch])
+            except Exception as e:
+                if len(batch) > 1:
+                    # Don't let one bad utterance fail everyone batched with it
+                    self._transcribe_each(batch)
+                    continue
+                errors.inc(component="voice_stt")
+                batch[0][2].set_exception(e)
+                continue
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _transcribe_each(self, batch: list):
+        """Fallback after a failed batch: one item at a time, failing only the items that fail."""
+        for audio, language, future in batch:
+            try:
+                with voice_stt_seconds.time():
+                    future.set_result(self._transcribe_batch([audio], [language])[0])
+            except Exception as e:
+                errors.inc(component="voice_stt")
+                future.set_exception(e)
+
+    def _transcribe_batch(self, audios: list[np.ndarray], languages: list[str | None]) -> list[tuple[str, str | None]]:
+        """One encoder pass and one decoder pass for the whole batch."""
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+
+        model = self.model
+        features = np.stack([pad_or_trim(model.feature_extractor(audio)) for audio in audios])
+        encoder_output = model.encode(features)
+
+        multilingual = model.model.is_multilingual
+        if not multilingual:
+            languages = ["en"] * len(audios)
+        elif any(lang is None for lang in languages):
+            detected = model.model.detect_language(encoder_output)
+            # Each entry is [(token, prob), ...] best first, tokens look like "<|hi|>"
+            languages = [lang or probs[0][0][2:-2] for lang, probs in zip(languages, detected)]
+
+        tokenizers = [
+            Tokenizer(model.hf_tokenizer, multilingual, task="transcribe", language=lang) for lang in languages
+        ]
+        prompts = [list(t.sot_sequence) + [t.no_timestamps] for t in tokenizers]
+        results = model.model.generate(
+            encoder_output, prompts,
+            beam_size=VOICE_BEAM_SIZE,
+            max_length=MAX_TEXT_TOKENS,
+            return_scores=True,
+            length_penalty=1,
+            return_no_speech_prob=True,
+            suppress_blank=True,
+            suppress_tokens=[-1]
+        )
+
+        transcripts = []
+        for tokenizer, language, result in zip(tokenizers, languages, results):
+            sequence = result.sequences_ids[0]
+            tokens = [t for t in sequence if t < tokenizer.eot]
+            # Whisper's own silence test: likely no speech and a low-confidence decode.
+            # The score is length-normalized (penalty 1); undo that and average over
+            # the tokens plus end-of-text, as faster-whisper's avg_logprob does
+            avg_logprob = result.scores[0] * len(sequence) / (len(sequence) + 1)
+            if result.no_speech_prob > VOICE_NO_SPEECH_THRESHOLD and avg_logprob < VOICE_LOG_PROB_THRESHOLD:
+                tokens = []
+            transcripts.append((tokenizer.decode(tokens).strip(), language))
+        return transcripts
+
+    def stats(self) -> dict:
+        return {
+            "sessions": self.sessions,
+            "batches": self.batches,
+            "utterances": self.utterances,
+            "avg_batch": self.utterances / self.batches if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "queued": self._queue.qsize(),
+        }
+
+class VoiceSession:
+    """One /api/voice connection: utterance detection, turns and barge-in.
+
+    Client -> server: binary frames of 16 kHz mono pcm_s16le (any size), and
+    JSON text frames {"type": "config", "language": "hi"} (pin the language)
+    or {"type": "end_utterance"} (push-to-talk release).
+    Server -> client: JSON events ready, speech_start, interrupted,
+    transcript, reply, audio_start, audio_end, error; reply audio arrives as
+    binary MP3 frames between audio_start and audio_end (always sent, even
+    if the reply was interrupted).
+    """
+
+    def __init__(self, websocket, chat_turn, pool: SpeechPool):
+        self.websocket = websocket
+        self.chat_turn = chat_turn  # async (text) -> ChatResponse
+        self.pool = pool
+        self.language = None
+        self._vad = pool.new_vad()
+        self._pending = bytearray()
+        self._preroll: deque = deque(maxlen=PREROLL_CHUNKS)
+        self._utterance: list[np.ndarray] = []
+        self._speech_chunks = 0
+        self._silence_chunks = 0
+        self._turn: asyncio.Task | None = None
+
+    async def _send(self, event: dict):
+        try:
+            await self.websocket.send_text(json.dumps(event))
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # Closed; run() notices on its next receive
+
+    async def _send_audio(self, data: bytes):
+        try:
+            await self.websocket.send_bytes(data)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+
+    async def run(self):
+        self.pool.sessions += 1
+        try:
+            await self._send({"type": "ready", "sample_rate": SAMPLE_RATE, "format": "pcm_s16le"})
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    await self._on_audio(message["bytes"])
+                elif message.get("text"):
+                    await self._on_control(message["text"])
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.pool.sessions -= 1
+            if self._turn is not None:
+                # Wait so the TTS stream and the admission slot are released now
+                self._turn.cancel()
+                with suppress(asyncio.CancelledError):
+                    await self._turn
+
+    async def _on_control(self, text: str):
+        try:
+            command = json.loads(text)
+        except ValueError:
+            await self._send({"type": "error", "detail": "Expected JSON"})
+            return
+        if command.get("type") == "config":
+            language = command.get("language") or None
+            if language is not None and not self.pool.supports_language(language):
+                await self._send({"type": "error", "detail": f"Unsupported language: {language}"})
+                return
+            self.language = language
+        elif command.get("type") == "end_utterance" and self._utterance:
+            self._end_utterance()
+
+    async def _on_audio(self, data: bytes):
+        self._pending.extend(data)
+        n = len(self._pending) // CHUNK_BYTES
+        if not n:
+            return
+        raw = bytes(self._pending[:n * CHUNK_BYTES])
+        del self._pending[:n * CHUNK_BYTES]
+        blocks = (np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768).reshape(n, CHUNK_SAMPLES)
+        probs = await self.pool.speech_probs(self._vad, blocks)
+        for block, prob in zip(blocks, probs):
+            await self._on_chunk(block, prob)
+
+    async def _on_chunk(self, block: np.ndarray, speech_prob: float):
+        is_speech = speech_prob > VOICE_VAD_THRESHOLD
+        if not self._utterance:
+            if not is_speech:
+                self._preroll.append(block)
+                return
+            self._utterance = list(self._preroll)
+            self._preroll.clear()
+            self._speech_chunks = self._silence_chunks = 0
+
+        self._utterance.append(block)
+        if is_speech:
+            self._speech_chunks += 1
+            self._silence_chunks = 0
+            if self._speech_chunks == MIN_SPEECH_CHUNKS:
+                await self._barge_in()
+        else:
+            self._silence_chunks += 1
+
+        if self._silence_chunks >= SILENCE_CHUNKS or len(self._utterance) >= MAX_UTTERANCE_CHUNKS:
+            self._end_utterance()
+
+    async def _barge_in(self):
+        """Real speech started: whatever the previous turn is doing is stale."""
+        await self._send({"type": "speech_start"})
+        if self._turn is not None and not self._turn.done():
+            self._turn.cancel()
+            await self._send({"type": "interrupted"})
+
+    def _end_utterance(self):
+        chunks, self._utterance = self._utterance, []
+        if self._speech_chunks < MIN_SPEECH_CHUNKS:
+            return  # Too short, probably noise
+        previous = self._turn
+        if previous is not None and previous.done():
+            previous = None
+        elif previous is not None:
+            previous.cancel()
+        self._turn = asyncio.create_task(self._respond(np.concatenate(chunks), previous))
+
+    async def _respond(self, audio: np.ndarray, superseded: asyncio.Task | None = None):
+        try:
+            text, language = await self.pool.transcribe(audio, self.language)
+            await self._send({"type": "transcript", "text": text, "language": language})
+            if not text:
+                return
+
+            if superseded is not None:
+                # A cancelled turn holds the session's admission slot until its
+                # pipeline thread stops; wait for that instead of hitting session_busy
+                await asyncio.wait([superseded])
+            result = await self.chat_turn(text)
+            await self._send({
+                "type": "reply",
+                "text": result.reply,
+                "english_meaning": result.english_meaning,
+                "session_id": result.session_id,
+                "message_id": result.message_id
+            })
+
+            if VOICE_TTS_ENABLED and result.reply.strip():
+                import edge_tts
+                await self._send({"type": "audio_start", "format": "audio/mpeg"})
+                try:
+                    async for chunk in edge_tts.Communicate(result.reply, VOICE_TTS_VOICE).stream():
+                        if chunk["type"] == "audio":
+                            await self._send_audio(chunk["data"])
+                finally:
+                    # Also when barged in or failed mid-stream, so the client can stop waiting for audio
+                    await self._send({"type": "audio_end"})
+        except AdmissionRejected as e:
+            await self._send({"type": "error", "status": e.status_code, "detail": e.detail, "retry_after": e.retry_after})
+        except Exception as e:
+            errors.inc(component="voice")
+            await self._send({"type": "error", "detail": str(e)})
+
+# Shared instance
+speech_pool = SpeechPool()
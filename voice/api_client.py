@@ -3,26 +3,56 @@ API Client for Kumaoni Chatbot
 
 Sends text to the existing /api/chat endpoint and returns the response.
 Does NOT modify any backend logic - purely a client.
+
+Async (httpx) so a turn's request can be cancelled the moment the user
+starts a new utterance; one client is reused so the connection stays alive
+between turns.
+
+If the backend still holds the session for a turn that was just cancelled
+(429), the request is retried once after the server's Retry-After.
 """
 
-import requests
+import asyncio
+import httpx
 from typing import Optional
 
-from config import CHAT_ENDPOINT
+from config import (
+    CHAT_ENDPOINT, HEALTH_ENDPOINT,
+    API_TIMEOUT_SECONDS, API_CONNECT_TIMEOUT_SECONDS, API_KEEPALIVE_SECONDS,
+    API_BUSY_RETRY_MAX_SECONDS
+)
 
 
 class APIClient:
     def __init__(self):
         self.session_id: Optional[str] = None
-        self._session = requests.Session()
-    
-    def chat(self, message: str) -> dict:
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily so it belongs to the voice loop's event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(API_TIMEOUT_SECONDS, connect=API_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(max_keepalive_connections=2, keepalive_expiry=API_KEEPALIVE_SECONDS)
+            )
+        return self._client
+
+    async def warm_up(self):
+        """Open (or refresh) the keep-alive connection, e.g. while the user is still talking."""
+        try:
+            await self._get_client().get(HEALTH_ENDPOINT)
+        except httpx.HTTPError:
+            pass  # chat() reports connection problems
+
+    async def chat(self, message: str) -> dict:
         """
         Send a message to the chatbot API.
-        
+
+        Cancelling the calling task aborts the request.
+
         Args:
             message: User's text message
-        
+
         Returns:
             Dict with keys: reply, english_meaning, session_id, success
         """
@@ -31,18 +61,18 @@ class APIClient:
                 "message": message,
                 "session_id": self.session_id
             }
-            
-            response = self._session.post(
-                CHAT_ENDPOINT,
-                json=payload,
-                timeout=30
-            )
-            
+
+            response = await self._get_client().post(CHAT_ENDPOINT, json=payload)
+            if response.status_code == 429:
+                # Usually the previous, cancelled turn still running on the backend
+                await asyncio.sleep(self._retry_after(response))
+                response = await self._get_client().post(CHAT_ENDPOINT, json=payload)
+
             if response.status_code == 200:
                 data = response.json()
                 # Update session ID for continuity
                 self.session_id = data.get("session_id")
-                
+
                 return {
                     "success": True,
                     "reply": data.get("reply", ""),
@@ -57,8 +87,8 @@ class APIClient:
                     "english_meaning": "",
                     "error": f"HTTP {response.status_code}"
                 }
-                
-        except requests.exceptions.ConnectionError:
+
+        except httpx.ConnectError:
             print("❌ Cannot connect to API. Is the backend running?")
             return {
                 "success": False,
@@ -74,12 +104,26 @@ class APIClient:
                 "english_meaning": "",
                 "error": str(e)
             }
-    
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> float:
+        try:
+            seconds = float(response.headers.get("Retry-After", 1))
+        except ValueError:
+            seconds = 1
+        return min(max(seconds, 0), API_BUSY_RETRY_MAX_SECONDS)
+
     def reset_session(self):
         """Start a new conversation session."""
         self.session_id = None
         print("🔄 Session reset. Starting new conversation.")
 
+    async def close(self):
+        """Close the HTTP connection pool."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
 
 # Singleton instance
 api_client = APIClient()
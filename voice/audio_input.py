@@ -2,7 +2,12 @@
 Audio Input Module with Voice Activity Detection (VAD)
 
 Uses silero-vad to detect when the user starts and stops speaking.
-Captures audio from microphone and returns complete utterances.
+Captures audio from microphone into a preallocated ring buffer and
+returns complete utterances as views into it.
+
+A dedicated VAD worker thread scores every captured chunk as it arrives
+and publishes the results; utterance detection and barge-in checks only
+consume them, so VAD never falls behind real time.
 """
 
 import numpy as np
@@ -10,12 +15,14 @@ import sounddevice as sd
 import torch
 import threading
 import queue
-from collections import deque
 
 from config import (
     SAMPLE_RATE, CHUNK_SAMPLES, CHANNELS,
-    VAD_THRESHOLD, SILENCE_DURATION_MS, MIN_SPEECH_DURATION_MS
+    VAD_THRESHOLD, MIN_SPEECH_DURATION_MS,
+    RING_BUFFER_SECONDS, STALE_AUDIO_MS, VAD_MAX_BATCH_CHUNKS
 )
+from ring_buffer import AudioRingBuffer
+from endpointing import Endpointer
 
 
 class AudioInput:
@@ -32,37 +39,83 @@ class AudioInput:
         # Audio settings - use exact 512 samples as required by silero-vad
         self.chunk_samples = CHUNK_SAMPLES
         chunk_ms = (CHUNK_SAMPLES / SAMPLE_RATE) * 1000  # ~32ms per chunk
-        self.silence_chunks = int(SILENCE_DURATION_MS / chunk_ms)
         self.min_speech_chunks = int(MIN_SPEECH_DURATION_MS / chunk_ms)
+        self.stale_samples = int(STALE_AUDIO_MS / 1000 * SAMPLE_RATE)
+        # Utterance views must survive a while after they are returned
+        self.max_utterance_samples = RING_BUFFER_SECONDS * SAMPLE_RATE // 2
         
         # State
         self.is_listening = False
         self.is_user_speaking = False
-        self._audio_queue = queue.Queue()
+        self._ring = AudioRingBuffer(RING_BUFFER_SECONDS * SAMPLE_RATE)
         self._stream = None
         self._lock = threading.Lock()
+        self.endpointer = Endpointer()
+        
+        # VAD worker output: (position, speech_prob) per chunk, oldest dropped when full
+        self._vad_results = queue.Queue(maxsize=RING_BUFFER_SECONDS * SAMPLE_RATE // CHUNK_SAMPLES)
+        self._vad_thread = None
+        # Set by the worker on speech at or after _armed_at (see arm_interruption)
+        self.speech_event = threading.Event()
+        self._armed_at = 0
+        self.vad_max_backlog = 0  # Most chunks the worker ever had to catch up on at once
+        self.stale_chunks_skipped = 0
         
     def _audio_callback(self, indata, frames, time, status):
         """Callback for audio stream - runs in separate thread."""
         if status:
             print(f"Audio status: {status}")
-        # Put audio chunk in queue for processing
-        self._audio_queue.put(indata.copy())
+        # Copy the (mono) block into the ring; no allocation here
+        self._ring.write(indata[:, 0])
     
-    def _get_speech_prob(self, audio_chunk: np.ndarray) -> float:
-        """Get speech probability for an audio chunk using silero-vad."""
-        # Convert to torch tensor
-        audio_tensor = torch.from_numpy(audio_chunk.flatten()).float()
-        
-        # Normalize if needed
-        if audio_tensor.abs().max() > 1.0:
-            audio_tensor = audio_tensor / audio_tensor.abs().max()
-        
-        # Get speech probability
-        with torch.no_grad():
-            speech_prob = self.vad_model(audio_tensor, SAMPLE_RATE).item()
+    def _get_speech_probs(self, blocks: np.ndarray) -> list[float]:
+        """
+        Score consecutive chunks (shape: chunks x CHUNK_SAMPLES) in order.
         
-        return speech_prob
+        silero-vad is recurrent, so consecutive chunks can't go through the
+        batch dimension: this is still one forward call per chunk. Taking
+        the backlog together only saves the per-read and per-tensor overhead.
+        """
+        audio_tensor = torch.from_numpy(blocks)
+        peaks = audio_tensor.abs().amax(dim=1, keepdim=True)
+        if (peaks > 1.0).any():
+            audio_tensor = audio_tensor / peaks.clamp(min=1.0)
+        with torch.inference_mode():
+            return [self.vad_model(row, SAMPLE_RATE).item() for row in audio_tensor]
+    
+    def _publish(self, position: int, speech_prob: float):
+        if speech_prob > VAD_THRESHOLD:
+            self.endpointer.note_speech(position)
+            if position >= self._armed_at:
+                self.speech_event.set()
+        try:
+            self._vad_results.put_nowait((position, speech_prob))
+        except queue.Full:
+            # Nobody is consuming (e.g. STT/API running); stale results go first
+            try:
+                self._vad_results.get_nowait()
+            except queue.Empty:
+                pass
+            self._vad_results.put_nowait((position, speech_prob))
+    
+    def _vad_loop(self):
+        """Worker: sole reader of the ring, scores every chunk as soon as it lands."""
+        self.vad_model.reset_states()
+        n = self.chunk_samples
+        while self.is_listening:
+            item = self._ring.read(n, timeout=0.1, max_blocks=VAD_MAX_BATCH_CHUNKS)
+            if item is None:
+                continue
+            position, audio = item
+            blocks = audio.reshape(-1, n)
+            self.vad_max_backlog = max(self.vad_max_backlog, len(blocks))
+            try:
+                probs = self._get_speech_probs(blocks)
+            except Exception as e:
+                print(f"❌ VAD error: {e}")
+                continue
+            for i, speech_prob in enumerate(probs):
+                self._publish(position + i * n, speech_prob)
     
     def start_listening(self):
         """Start the audio input stream."""
@@ -78,6 +131,8 @@ class AudioInput:
             callback=self._audio_callback
         )
         self._stream.start()
+        self._vad_thread = threading.Thread(target=self._vad_loop, name="vad-worker", daemon=True)
+        self._vad_thread.start()
         print("🎤 Microphone active. Speak now...")
     
     def stop_listening(self):
@@ -87,75 +142,110 @@ class AudioInput:
             self._stream.stop()
             self._stream.close()
             self._stream = None
-        # Clear queue
-        while not self._audio_queue.empty():
+        if self._vad_thread is not None:
+            self._vad_thread.join()
+            self._vad_thread = None
+        # Producer and consumer are stopped, safe to reset
+        self._ring.clear()
+        self.endpointer.reset_positions()
+        while not self._vad_results.empty():
             try:
-                self._audio_queue.get_nowait()
+                self._vad_results.get_nowait()
             except queue.Empty:
                 break
     
-    def wait_for_utterance(self) -> np.ndarray | None:
+    def stats(self) -> dict:
+        """Capture and VAD counters (overruns = unread audio that was overwritten)."""
+        return {
+            **self._ring.stats(),
+            "vad_max_backlog_chunks": self.vad_max_backlog,
+            "stale_chunks_skipped": self.stale_chunks_skipped,
+            "endpointing": self.endpointer.stats(),
+        }
+    
+    def wait_for_utterance(self, stream=None, on_speech=None) -> np.ndarray | None:
         """
         Wait for user to speak and return the complete utterance.
         
         Returns audio as numpy array once user stops speaking,
-        or None if listening was stopped.
+        or None if listening was stopped. If a StreamingTranscription
+        is given, utterance audio is fed to it as it is captured and its
+        partial transcript helps decide when the turn is over.
+        on_speech() is called (from this thread) once the utterance has
+        MIN_SPEECH_DURATION_MS of speech, i.e. as soon as it is clearly not noise.
+        
+        The array is a view into the capture ring buffer, valid for at
+        least RING_BUFFER_SECONDS / 2 of further capture; copy it to keep it.
         """
-        audio_buffer = []
-        silence_count = 0
+        ring = self._ring
+        endpointer = self.endpointer
+        transcript_fn = stream.partial_text if stream is not None else None
+        utterance_start = 0
         speech_count = 0
         is_speaking = False
         
-        # Reset VAD state
-        self.vad_model.reset_states()
+        # Don't process audio that piled up while we were busy elsewhere
+        cutoff = ring.write_position - self.stale_samples
         
         print("⏳ Waiting for speech...")
         
         while self.is_listening:
+            # Get the next VAD result (with timeout to allow checking is_listening)
             try:
-                # Get audio chunk (with timeout to allow checking is_listening)
-                chunk = self._audio_queue.get(timeout=0.1)
+                position, speech_prob = self._vad_results.get(timeout=0.1)
             except queue.Empty:
                 continue
-            
-            # Get speech probability
-            speech_prob = self._get_speech_prob(chunk)
+            if position < cutoff:
+                self.stale_chunks_skipped += 1
+                continue
+            chunk = ring.view(position, position + self.chunk_samples)
             is_speech = speech_prob > VAD_THRESHOLD
             
             if is_speech:
                 if not is_speaking:
                     is_speaking = True
+                    utterance_start = position
+                    endpointer.start_utterance()
                     with self._lock:
                         self.is_user_speaking = True
                     print("🗣️ Speech detected...")
                 
-                silence_count = 0
                 speech_count += 1
-                audio_buffer.append(chunk)
+                if speech_count == self.min_speech_chunks and on_speech is not None:
+                    on_speech()
                 
-            elif is_speaking:
-                # User was speaking, now detecting silence
-                silence_count += 1
-                audio_buffer.append(chunk)  # Keep some trailing silence
+            elif not is_speaking:
+                # Background audio between utterances
+                endpointer.observe_background(chunk)
+                continue
+            
+            # Trailing silence stays in the utterance too
+            if stream is not None:
+                stream.feed(chunk)
+            
+            utterance_end = position + self.chunk_samples
+            ended = endpointer.update(speech_prob, chunk, transcript_fn)
+            too_long = utterance_end - utterance_start >= self.max_utterance_samples
+            if too_long:
+                print("⚠️ Utterance too long, cutting it here.")
+            
+            if ended or too_long:
+                # User has stopped speaking
+                with self._lock:
+                    self.is_user_speaking = False
                 
-                if silence_count >= self.silence_chunks:
-                    # User has stopped speaking
-                    with self._lock:
-                        self.is_user_speaking = False
-                    
-                    # Check if we got enough speech
-                    if speech_count >= self.min_speech_chunks:
-                        print("✅ Speech complete.")
-                        # Concatenate all audio chunks
-                        full_audio = np.concatenate(audio_buffer, axis=0)
-                        return full_audio.flatten()
-                    else:
-                        # Too short, probably noise - reset and continue
-                        print("⚠️ Too short, ignoring...")
-                        audio_buffer = []
-                        silence_count = 0
-                        speech_count = 0
-                        is_speaking = False
+                # Check if we got enough speech
+                if speech_count >= self.min_speech_chunks:
+                    endpointer.end_utterance(utterance_end)
+                    print("✅ Speech complete.")
+                    return ring.view(utterance_start, utterance_end)
+                else:
+                    # Too short, probably noise - reset and continue
+                    print("⚠️ Too short, ignoring...")
+                    if stream is not None:
+                        stream.reset()
+                    speech_count = 0
+                    is_speaking = False
         
         return None
     
@@ -164,23 +254,22 @@ class AudioInput:
         with self._lock:
             return self.is_user_speaking
     
+    def arm_interruption(self):
+        """Start watching for barge-in from now on (call right before playback)."""
+        self._armed_at = self._ring.write_position
+        self.speech_event.clear()
+    
     def check_for_interruption(self) -> bool:
         """
-        Quick check if there's any speech happening right now.
-        Used during TTS playback to detect interruption.
+        Quick check if the user has spoken since arm_interruption().
+        Used during TTS playback to detect interruption; just reads the
+        event the VAD worker sets, so it costs nothing to poll.
         """
-        try:
-            # Check if there's audio in queue
-            chunk = self._audio_queue.get_nowait()
-            speech_prob = self._get_speech_prob(chunk)
-            
-            if speech_prob > VAD_THRESHOLD:
-                with self._lock:
-                    self.is_user_speaking = True
-                return True
-            return False
-        except queue.Empty:
-            return False
+        if self.speech_event.is_set():
+            with self._lock:
+                self.is_user_speaking = True
+            return True
+        return False
 
 
 # Singleton instance
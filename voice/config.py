@@ -1,28 +1,73 @@
 # Voice Client Configuration
 
+from pathlib import Path
+
 # API Settings
 API_BASE_URL = "http://localhost:8000"
 CHAT_ENDPOINT = f"{API_BASE_URL}/api/chat"
+HEALTH_ENDPOINT = f"{API_BASE_URL}/api/health"
+API_TIMEOUT_SECONDS = 30
+API_CONNECT_TIMEOUT_SECONDS = 5
+API_KEEPALIVE_SECONDS = 4  # Below uvicorn's 5 s idle timeout, so we never reuse a closing connection
+API_BUSY_RETRY_MAX_SECONDS = 5  # Longest Retry-After we wait out once when the session is still busy
 
 # Whisper STT Settings
 WHISPER_MODEL_SIZE = "base"  # Options: tiny, base, small, medium, large-v3
 WHISPER_DEVICE = "cpu"  # Use "cuda" if you have NVIDIA GPU
 WHISPER_COMPUTE_TYPE = "int8"  # Use "float16" for GPU
 
+# STT tiering: a fast model first, WHISPER_MODEL_SIZE only when it's unsure
+STT_TIERED = True
+WHISPER_FAST_MODEL_SIZE = "tiny"  # Greedy decoding, language pinned once known
+STT_FAST_MAX_SECONDS = 8  # Longer utterances skip the fast tier until the language is pinned
+STT_FALLBACK_LOGPROB = -0.8  # Fast-tier results with a lower average log-probability are redone
+STT_PIN_LANGUAGE_PROB = 0.8  # Detection confidence needed to pin the session language
+STT_WARMUP = True  # Decode a silent clip on each model at startup
+
+# Streaming STT: decode while the user is still speaking
+STT_STREAMING = True  # False = transcribe the whole utterance after it ends
+STT_STREAM_STEP_MS = 1000  # Re-decode the growing window after this much new audio
+STT_STREAM_BEAM_SIZE = 1  # Greedy for partial decodes; the final tail uses beam_size=5 (1 on the fast tier)
+STT_STREAM_MAX_WINDOW_S = 20  # Force-commit the hypothesis if the window grows past this
+
 # VAD Settings
 VAD_THRESHOLD = 0.5  # Speech probability threshold (0.0 - 1.0)
-SILENCE_DURATION_MS = 800  # Silence duration to detect end of speech
+SILENCE_DURATION_MS = 800  # Fixed end-of-speech silence (used when ENDPOINTING_ADAPTIVE is off)
 MIN_SPEECH_DURATION_MS = 250  # Minimum speech duration to consider valid
+VAD_MAX_BATCH_CHUNKS = 16  # Backlog the VAD worker takes per ring read when it falls behind (still scored chunk by chunk)
+
+# End-of-turn detection
+ENDPOINTING_ADAPTIVE = True  # Adapt the silence threshold to the speaker (see endpointing.py)
+ENDPOINT_MIN_SILENCE_MS = 300
+ENDPOINT_MAX_SILENCE_MS = 1500
+ENDPOINT_FALSE_CUTOFF_MS = 1500  # Speech resuming this soon after an endpoint counts as a false cutoff
 
 # Audio Settings
 SAMPLE_RATE = 16000  # Required by Whisper and silero-vad
 CHUNK_SAMPLES = 512  # Exact samples per chunk (silero-vad requires 512 for 16kHz)
 CHANNELS = 1  # Mono audio
+RING_BUFFER_SECONDS = 30  # Capture buffer; utterances are capped at half of this
+STALE_AUDIO_MS = 1000  # Unread audio older than this is skipped when listening resumes
 
 # TTS Settings
 TTS_ENGINE = "edge-tts"  # Options: edge-tts, pyttsx3
 EDGE_TTS_VOICE = "hi-IN-SwaraNeural"  # Hindi female voice (good for Kumaoni)
 # Alternative voices: "hi-IN-MadhurNeural" (male)
+TTS_SAMPLE_RATE = 24000  # edge-tts streams 24 kHz mono MP3; playback runs at this rate
+TTS_PIPELINE = True  # Synthesize sentence n+1 while sentence n plays
+TTS_LOOKAHEAD_SEGMENTS = 1  # Segments synthesized ahead of the one playing
+TTS_FIRST_SEGMENT_CHARS = 60  # Keep the first segment short so audio starts sooner
+TTS_MAX_SEGMENT_CHARS = 160  # Longer sentences are split at commas
+
+# TTS audio cache (content-addressed by text + voice + engine)
+TTS_CACHE_ENABLED = True
+TTS_CACHE_DIR = Path(__file__).parent / ".tts_cache"
+TTS_CACHE_MEMORY_BYTES = 32 * 1024 * 1024  # Decoded PCM kept in RAM
+TTS_CACHE_DISK_BYTES = 256 * 1024 * 1024
+TTS_CACHE_MAX_CHARS = 120  # Only cache segments up to this long (greetings, acknowledgements)
+TTS_PREWARM_COUNT = 50  # Most common reply segments to synthesize at startup; 0 disables
+TTS_PREWARM_SCAN = 5000  # Recent assistant messages scanned for them
+CHATBOT_DB_PATH = Path(__file__).parent.parent / "backend" / "database" / "chatbot.db"
 
 # Interruption Settings
-INTERRUPTION_CHECK_INTERVAL_MS = 100  # How often to check for interruption during TTS
+INTERRUPTION_CHECK_INTERVAL_MS = 32  # How often playback checks the VAD speech event (~one chunk)
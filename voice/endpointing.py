@@ -0,0 +1,187 @@
+"""
+Adaptive End-of-Turn Detection
+
+Decides when the user has finished speaking. Instead of a fixed
+SILENCE_DURATION_MS, the silence needed to end a turn adapts to:
+- the speaker's own pause rhythm (running mean/std of pauses inside
+  utterances; hesitant speakers get more time, fluent ones less)
+- how clean the silence is (VAD probabilities hovering near the
+  threshold, or energy well above the noise floor, count as half silence)
+- optionally, the partial transcript (a trailing "and"/"aur"/"um" holds
+  the turn open)
+
+It also measures itself: endpointing delay (silence from last speech to
+the decision) and false cutoffs (the user starts speaking again within
+ENDPOINT_FALSE_CUTOFF_MS of an endpoint). False cutoffs feed back into
+the pause statistics so the threshold grows for that speaker. They are
+judged by ring-buffer sample positions, not arrival order: the VAD worker
+runs ahead of the consumer, so speech right after an endpoint may already
+have been seen by the time end_utterance() is called.
+
+note_speech() runs on the VAD worker thread while the rest runs on the
+capture thread, so the pause statistics and endpoint bookkeeping they share
+are guarded by a lock.
+"""
+
+import threading
+from collections import deque
+
+import numpy as np
+
+from config import (
+    SAMPLE_RATE, CHUNK_SAMPLES, VAD_THRESHOLD, SILENCE_DURATION_MS,
+    ENDPOINTING_ADAPTIVE, ENDPOINT_MIN_SILENCE_MS, ENDPOINT_MAX_SILENCE_MS,
+    ENDPOINT_FALSE_CUTOFF_MS
+)
+
+# Words that suggest the speaker isn't done yet (English, Hindi, Kumaoni fillers)
+CONTINUATION_WORDS = {
+    "and", "but", "or", "so", "because", "the", "a", "to", "of", "with", "um", "uh", "hmm",
+    "aur", "lekin", "par", "ki", "ke", "ka", "toh", "jo", "ya", "phir", "matlab",
+}
+
+SPEECH_HISTORY_CHUNKS = 1024  # Recent speech positions kept for endpoints the consumer reports late (~33 s)
+PAUSE_EMA_ALPHA = 0.1
+NOISE_EMA_ALPHA = 0.05
+NOISE_RATIO = 3.0  # Energy this far above the noise floor isn't clean silence
+
+
+class Endpointer:
+    def __init__(self, adaptive: bool = ENDPOINTING_ADAPTIVE):
+        self.adaptive = adaptive
+        self.chunk_ms = CHUNK_SAMPLES / SAMPLE_RATE * 1000
+        self._lock = threading.Lock()
+
+        # Speaker pause statistics (ms), seeded so the first threshold is close to the old fixed one
+        self.pause_mean = SILENCE_DURATION_MS / 3
+        self.pause_var = (SILENCE_DURATION_MS / 5) ** 2
+        self.noise_floor = None  # RMS of background audio
+
+        # Per-utterance state
+        self._silence_ms = 0.0  # Effective (weighted) silence in the current run
+        self._raw_silence_ms = 0.0  # Wall-clock silence since the last speech chunk
+        self._recent_probs = deque(maxlen=6)  # VAD probabilities in the current silence run
+
+        # Metrics
+        self.delays_ms = deque(maxlen=500)
+        self.utterances = 0
+        self.false_cutoffs = 0
+        self._last_end = None  # Sample position of the last endpoint still waiting for a verdict
+        self._last_delay_ms = 0.0
+        self._speech_positions = deque(maxlen=SPEECH_HISTORY_CHUNKS)  # From the VAD worker, ascending
+
+    def threshold_ms(self) -> float:
+        """Silence currently needed to end a turn, before per-chunk adjustments."""
+        if not self.adaptive:
+            return SILENCE_DURATION_MS
+        # Comfortably above this speaker's typical long pause
+        with self._lock:
+            mean, std = self.pause_mean, self.pause_var ** 0.5
+        return float(np.clip(mean + 2 * std + 100, ENDPOINT_MIN_SILENCE_MS, ENDPOINT_MAX_SILENCE_MS))
+
+    def _record_pause(self, pause_ms: float):
+        """Caller holds the lock."""
+        delta = pause_ms - self.pause_mean
+        self.pause_mean += PAUSE_EMA_ALPHA * delta
+        self.pause_var = (1 - PAUSE_EMA_ALPHA) * (self.pause_var + PAUSE_EMA_ALPHA * delta * delta)
+
+    def observe_background(self, chunk: np.ndarray):
+        """Feed audio heard outside any utterance, to track the noise floor."""
+        rms = float(np.sqrt(np.mean(np.square(chunk)))) if chunk.size else 0.0
+        if self.noise_floor is None:
+            self.noise_floor = rms
+        else:
+            self.noise_floor += NOISE_EMA_ALPHA * (rms - self.noise_floor)
+
+    def note_speech(self, position: int):
+        """
+        Speech heard at sample `position`, from the VAD worker (which sees
+        every chunk, even while the voice loop is busy with STT/API/TTS).
+        """
+        with self._lock:
+            self._speech_positions.append(position)
+            if self._last_end is not None and position >= self._last_end:
+                self._judge_endpoint(position)
+
+    def _judge_endpoint(self, speech_position: int):
+        """First speech at or after the pending endpoint. Caller holds the lock."""
+        gap_ms = (speech_position - self._last_end) / SAMPLE_RATE * 1000
+        self._last_end = None
+        if gap_ms <= ENDPOINT_FALSE_CUTOFF_MS:
+            # We cut them off mid-thought: the real pause was at least delay + gap
+            self.false_cutoffs += 1
+            if self.adaptive:
+                self._record_pause(self._last_delay_ms + gap_ms)
+
+    def reset_positions(self):
+        """Forget sample positions (the capture ring was cleared and restarts at 0)."""
+        with self._lock:
+            self._speech_positions.clear()
+            self._last_end = None
+
+    def start_utterance(self):
+        """Reset per-utterance state at speech onset."""
+        self._silence_ms = 0.0
+        self._raw_silence_ms = 0.0
+        self._recent_probs.clear()
+
+    def update(self, speech_prob: float, chunk: np.ndarray, transcript_fn=None) -> bool:
+        """Feed one in-utterance chunk; returns True when the turn looks complete."""
+        if speech_prob > VAD_THRESHOLD:
+            # A pause inside the utterance just ended: learn from it
+            if self.adaptive and self._raw_silence_ms >= 2 * self.chunk_ms:
+                with self._lock:
+                    self._record_pause(self._raw_silence_ms)
+            self._silence_ms = 0.0
+            self._raw_silence_ms = 0.0
+            self._recent_probs.clear()
+            return False
+
+        self._recent_probs.append(speech_prob)
+        self._raw_silence_ms += self.chunk_ms
+        weight = 1.0
+        if self.adaptive:
+            # Uncertain silence (VAD trending near threshold, or audible energy) counts half
+            hovering = np.mean(self._recent_probs) > VAD_THRESHOLD * 0.5
+            rms = float(np.sqrt(np.mean(np.square(chunk)))) if chunk.size else 0.0
+            loud = self.noise_floor is not None and rms > NOISE_RATIO * max(self.noise_floor, 1e-4)
+            if hovering or loud:
+                weight = 0.5
+        self._silence_ms += weight * self.chunk_ms
+
+        required = self.threshold_ms()
+        if self.adaptive and transcript_fn is not None and self._silence_ms >= ENDPOINT_MIN_SILENCE_MS:
+            # Only ever lengthens the wait: the partial transcript can lag the
+            # audio by a decode step, so it is not trusted to end a turn early
+            words = transcript_fn().strip().lower().rstrip(",;:-").split()
+            if words and words[-1] in CONTINUATION_WORDS:
+                required = ENDPOINT_MAX_SILENCE_MS
+
+        return self._silence_ms >= required
+
+    def end_utterance(self, position: int):
+        """Record an accepted endpoint at sample `position` (end of the returned audio)."""
+        with self._lock:
+            self.utterances += 1
+            self._last_delay_ms = self._raw_silence_ms
+            self.delays_ms.append(self._raw_silence_ms)
+            self._last_end = position
+            # The worker may already have heard them start again
+            later = next((p for p in self._speech_positions if p >= position), None)
+            if later is not None:
+                self._judge_endpoint(later)
+
+    def stats(self) -> dict:
+        threshold_ms = round(self.threshold_ms())
+        with self._lock:
+            delays = np.array(self.delays_ms) if self.delays_ms else None
+            utterances, false_cutoffs = self.utterances, self.false_cutoffs
+        return {
+            "utterances": utterances,
+            "threshold_ms": threshold_ms,
+            "delay_ms_p50": round(float(np.percentile(delays, 50))) if delays is not None else None,
+            "delay_ms_p95": round(float(np.percentile(delays, 95))) if delays is not None else None,
+            "false_cutoffs": false_cutoffs,
+            "false_cutoff_rate": false_cutoffs / utterances if utterances else 0.0,
+            "noise_floor": self.noise_floor,
+        }
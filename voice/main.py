@@ -16,7 +16,7 @@ Prerequisites:
    cd voice && python main.py
 
 First run will download:
-- Whisper model (~150MB for 'base')
+- Whisper models (~150MB for 'base', ~75MB for the 'tiny' fast tier)
 - Silero VAD model (~100MB)
 """
 
@@ -0,0 +1,143 @@
+"""
+Preallocated Audio Ring Buffer
+
+Fixed-capacity float32 buffer between the sounddevice callback (single
+producer) and the VAD/utterance code (single consumer). Nothing is
+allocated per block: the callback copies samples in, readers get numpy
+views out.
+
+Positions are absolute sample counts since the last clear(), so a range
+like "utterance start .. now" stays meaningful while the buffer wraps.
+Every block is written twice (at i and i + capacity) so any range up to
+`capacity` samples is one contiguous view, even across the wrap point.
+
+Protocol: only the producer advances `_write`, only the consumer advances
+`_read`, both are plain ints (atomic under the GIL) and the producer
+publishes `_write` after the data is copied. When the consumer falls more
+than `capacity` behind, the oldest audio is overwritten; the producer
+counts it as an overrun and the consumer skips ahead on its next read.
+"""
+
+import threading
+
+import numpy as np
+
+
+class AudioRingBuffer:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = np.zeros(capacity * 2, dtype=np.float32)
+        self._write = 0
+        self._read = 0
+        self._available = threading.Event()  # Wake-up only; the data path takes no lock
+
+        # Producer-side counters
+        self.overruns = 0  # Blocks that overwrote unread audio
+        self.overrun_samples = 0
+        # Consumer-side counter
+        self.skipped_samples = 0  # Stale audio deliberately skipped by skip_to()
+
+    # -- producer ------------------------------------------------------
+
+    def write(self, block: np.ndarray):
+        """Copy one block in (producer thread only)."""
+        total = block.shape[0]
+        n = min(total, self.capacity)
+        if n < total:
+            # Only the newest `capacity` samples fit; the prefix is lost but still
+            # takes up positions, so later positions keep matching capture time
+            block = block[-n:]
+        start = (self._write + total - n) % self.capacity
+        first = min(n, self.capacity - start)
+        # Primary copy, then the mirror half so reads never need to wrap
+        self._data[start:start + first] = block[:first]
+        self._data[start + self.capacity:start + self.capacity + first] = block[:first]
+        if first < n:
+            self._data[:n - first] = block[first:]
+            self._data[self.capacity:self.capacity + n - first] = block[first:]
+
+        lost = self._write + total - self._read - self.capacity
+        if lost > 0:
+            self.overruns += 1
+            self.overrun_samples += min(lost, total)
+        self._write += total
+        self._available.set()
+
+    # -- consumer ------------------------------------------------------
+
+    @property
+    def write_position(self) -> int:
+        return self._write
+
+    @property
+    def read_position(self) -> int:
+        return self._read
+
+    def _catch_up(self):
+        """Jump past audio the producer has already overwritten."""
+        oldest = self._write - self.capacity
+        if self._read < oldest:
+            self._read = oldest
+
+    def view(self, start: int, end: int) -> np.ndarray:
+        """
+        Zero-copy view of samples [start, end) by absolute position.
+
+        Only valid until the producer overwrites it, i.e. for roughly
+        (capacity - (write_position - start)) samples of further capture.
+        Copy it to keep it longer.
+        """
+        end = min(end, self._write)
+        start = max(start, self._write - self.capacity, 0)
+        if end <= start:
+            return self._data[:0]
+        offset = start % self.capacity
+        return self._data[offset:offset + (end - start)]
+
+    def read(self, n: int, timeout: float | None = None, max_blocks: int = 1) -> tuple[int, np.ndarray] | None:
+        """
+        Take the next n samples as (position, view), waiting up to `timeout`.
+
+        With max_blocks > 1, takes as many whole n-sample blocks as are
+        already available (up to max_blocks) in one contiguous view.
+        Returns None if not enough audio arrived in time.
+        """
+        while True:
+            self._catch_up()
+            if self._write - self._read >= n:
+                blocks = min(max_blocks, (self._write - self._read) // n)
+                position = self._read
+                self._read += blocks * n
+                return position, self.view(position, position + blocks * n)
+            self._available.clear()
+            # Re-check after clearing so a write between the two isn't missed
+            if self._write - self._read >= n:
+                continue
+            if timeout == 0 or not self._available.wait(timeout):
+                return None
+
+    def pending(self) -> int:
+        """Unread samples (capped at capacity)."""
+        return min(self._write - self._read, self.capacity)
+
+    def skip_to(self, position: int):
+        """Drop unread audio before `position` (e.g. stale audio from while we weren't listening)."""
+        position = min(position, self._write)
+        if position > self._read:
+            self.skipped_samples += max(0, position - max(self._read, self._write - self.capacity))
+            self._read = position
+
+    def clear(self):
+        """Reset positions and counters. Only call while the producer is stopped."""
+        self._write = self._read = 0
+        self.overruns = self.overrun_samples = self.skipped_samples = 0
+        self._available.clear()
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "pending": self.pending(),
+            "overruns": self.overruns,
+            "overrun_samples": self.overrun_samples,
+            "skipped_samples": self.skipped_samples,
+        }
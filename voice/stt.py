@@ -2,61 +2,337 @@
 Speech-to-Text Module using faster-whisper
 
 Converts audio numpy arrays to text using the Whisper model.
+Also supports streaming transcription: audio is fed in while the user
+is still speaking, and only the unconfirmed tail is decoded at the end.
+
+With STT_TIERED, a small fast model (greedy, language pinned for the
+session once detected) handles short utterances and all streaming, and
+results with a low average log-probability are redone on the main model.
+Real-time factor (decode time / audio time) is tracked per tier.
 """
 
+import math
+import threading
+import time
+
 from faster_whisper import WhisperModel
 import numpy as np
 
-from config import WHISPER_MODEL_SIZE, WHISPER_DEVICE, WHISPER_COMPUTE_TYPE, SAMPLE_RATE
+from config import (
+    WHISPER_MODEL_SIZE, WHISPER_DEVICE, WHISPER_COMPUTE_TYPE, SAMPLE_RATE,
+    STT_STREAM_STEP_MS, STT_STREAM_BEAM_SIZE, STT_STREAM_MAX_WINDOW_S,
+    STT_TIERED, WHISPER_FAST_MODEL_SIZE, STT_FAST_MAX_SECONDS, STT_FALLBACK_LOGPROB,
+    STT_PIN_LANGUAGE_PROB, STT_WARMUP
+)
+
+
+def _prepare(audio: np.ndarray) -> np.ndarray:
+    """Float32, peak-normalized if the input is out of range."""
+    if audio.dtype != np.float32:
+        audio = audio.astype(np.float32)
+    peak = np.abs(audio).max() if audio.size else 0.0
+    if peak > 1.0:
+        audio = audio / peak
+    return audio
+
+
+def _normalize_word(word: str) -> str:
+    return word.strip().lower().strip(".,!?।\"'")
+
+
+class StreamingTranscription:
+    """
+    Incremental transcription of one utterance.
+
+    A worker thread re-decodes the unconfirmed window every STT_STREAM_STEP_MS
+    of new audio. Words that two consecutive decodes agree on are committed and
+    their audio is dropped from the window, so the final decode in finish()
+    only covers the short unconfirmed tail.
+    """
+
+    def __init__(self, model: WhisperModel, language: str | None = None, final_beam_size: int = 5):
+        self.model = model
+        self.language = language
+        self.language_probability = 1.0 if language else 0.0
+        self.final_beam_size = final_beam_size
+        self.committed: list[str] = []
+        self._word_logprobs: list[float] = []  # one per committed word
+        self._pending: list[tuple[str, float, float, float]] = []  # last unconfirmed hypothesis
+        self.audio_seconds = 0.0  # Everything fed, for the real-time factor
+        self.decode_seconds = 0.0  # Time spent in all decodes (partials included)
+        self._chunks: list[np.ndarray] = []
+        self._buffered = 0  # samples in _chunks
+        self._offset = 0  # samples already committed and dropped
+        self._generation = 0  # bumped by reset() so in-flight decodes are discarded
+        self._decoded_upto = 0  # buffered sample count at the last decode
+        self._step = int(STT_STREAM_STEP_MS / 1000 * SAMPLE_RATE)
+        self._lock = threading.Lock()
+        self._new_audio = threading.Condition(self._lock)
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def feed(self, chunk: np.ndarray):
+        """Append captured audio (any length, mono float32)."""
+        # Callers pass ring-buffer views that get overwritten later; keep our own copy
+        chunk = np.array(chunk, dtype=np.float32, copy=True).reshape(-1)
+        with self._new_audio:
+            self._chunks.append(chunk)
+            self._buffered += chunk.size
+            self.audio_seconds += chunk.size / SAMPLE_RATE
+            if self._buffered - self._decoded_upto >= self._step:
+                self._new_audio.notify()
+
+    def reset(self):
+        """Discard everything fed so far (e.g. the utterance was too short)."""
+        with self._lock:
+            self.committed = []
+            self._word_logprobs = []
+            self._pending = []
+            self._chunks = []
+            self.audio_seconds = 0.0
+            self._buffered = self._offset = self._decoded_upto = 0
+            self._generation += 1
+
+    def partial_text(self) -> str:
+        """Committed words plus the latest unconfirmed hypothesis."""
+        with self._lock:
+            words = self.committed + [w for w, _, _, _ in self._pending]
+        return "".join(words).strip()
+
+    def _window(self) -> tuple[np.ndarray, int]:
+        """Current unconfirmed audio and its start offset in samples. Caller holds the lock."""
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        window = self._chunks[0] if self._chunks else np.zeros(0, dtype=np.float32)
+        return window, self._offset
+
+    def avg_logprob(self) -> float:
+        """Mean log-probability of the committed words (-inf if there are none)."""
+        if not self._word_logprobs:
+            return float("-inf")
+        return sum(self._word_logprobs) / len(self._word_logprobs)
+
+    def _decode(self, audio: np.ndarray, offset: int, beam_size: int) -> list[tuple[str, float, float, float]]:
+        """Words with absolute start/end times (seconds from utterance start) and log-probability."""
+        prompt = "".join(self.committed[-30:]).strip() or None
+        started = time.perf_counter()
+        segments, info = self.model.transcribe(
+            _prepare(audio),
+            beam_size=beam_size,
+            language=self.language,
+            word_timestamps=True,
+            condition_on_previous_text=False,
+            initial_prompt=prompt,
+            vad_filter=False  # VAD already cut the utterance; windows are mostly speech
+        )
+        base = offset / SAMPLE_RATE
+        words = [
+            (w.word, base + w.start, base + w.end, math.log(max(w.probability, 1e-6)))
+            for s in segments for w in (s.words or [])
+        ]
+        self.decode_seconds += time.perf_counter() - started
+        # Pin the language once Whisper is confident so later windows skip detection
+        if self.language is None and info.language_probability >= 0.5:
+            self.language = info.language
+            self.language_probability = info.language_probability
+        return words
+
+    def _commit(self, words: list[tuple[str, float, float, float]]):
+        """Commit words and drop their audio from the window. Caller holds the lock."""
+        self.committed.extend(w[0] for w in words)
+        self._word_logprobs.extend(w[3] for w in words)
+        end = int(words[-1][2] * SAMPLE_RATE) - self._offset
+        end = max(0, min(end, self._buffered))
+        window, _ = self._window()
+        self._chunks = [window[end:]]
+        self._buffered -= end
+        self._decoded_upto = max(0, self._decoded_upto - end)
+        self._offset += end
+
+    def _run(self):
+        while True:
+            with self._new_audio:
+                while not self._closed and self._buffered - self._decoded_upto < self._step:
+                    self._new_audio.wait()
+                if self._closed:
+                    return
+                audio, offset = self._window()
+                generation = self._generation
+                self._decoded_upto = self._buffered
+
+            # Decode outside the lock so feed() never blocks the audio path
+            try:
+                words = self._decode(audio, offset, STT_STREAM_BEAM_SIZE)
+            except Exception as e:
+                print(f"❌ Streaming STT error: {e}")
+                continue
+
+            with self._lock:
+                if generation != self._generation:
+                    continue  # reset() happened mid-decode
+                agreed = 0
+                for prev, new in zip(self._pending, words):
+                    if _normalize_word(prev[0]) != _normalize_word(new[0]):
+                        break
+                    agreed += 1
+                # A window that never stabilizes would grow without bound
+                if not agreed and words and audio.size > STT_STREAM_MAX_WINDOW_S * SAMPLE_RATE:
+                    agreed = max(1, len(words) - 2)
+                if agreed:
+                    self._commit(words[:agreed])
+                self._pending = words[agreed:]
+
+    def close(self):
+        """Abandon the stream: drop its audio and let the worker exit, without a final decode."""
+        self.reset()
+        with self._new_audio:
+            self._closed = True
+            self._new_audio.notify()
+
+    def finish(self) -> str:
+        """Stop streaming, decode the remaining tail and return the full text."""
+        with self._new_audio:
+            self._closed = True
+            self._new_audio.notify()
+        self._worker.join()
+
+        with self._lock:
+            audio, offset = self._window()
+        if audio.size >= SAMPLE_RATE // 10:
+            try:
+                tail = self._decode(audio, offset, beam_size=self.final_beam_size)
+            except Exception as e:
+                print(f"❌ STT error: {e}")
+                tail = self._pending
+            self.committed.extend(w[0] for w in tail)
+            self._word_logprobs.extend(w[3] for w in tail)
+        self._pending = []
+
+        full_text = "".join(self.committed).strip()
+        if full_text:
+            print(f"📝 Transcribed: {full_text}")
+            print(f"   (Detected language: {self.language or 'unknown'})")
+        return full_text
+
+
+class TierStats:
+    """Real-time factor bookkeeping for one model tier."""
+
+    def __init__(self, model_size: str):
+        self.model_size = model_size
+        self.utterances = 0
+        self.audio_seconds = 0.0
+        self.decode_seconds = 0.0
+
+    def record(self, audio_seconds: float, decode_seconds: float):
+        self.utterances += 1
+        self.audio_seconds += audio_seconds
+        self.decode_seconds += decode_seconds
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_size,
+            "utterances": self.utterances,
+            "audio_seconds": self.audio_seconds,
+            "rtf": self.decode_seconds / self.audio_seconds if self.audio_seconds else None,
+        }
+
+
+def _load_model(size: str) -> WhisperModel:
+    print(f"Loading Whisper model ({size})...")
+    model = WhisperModel(size, device=WHISPER_DEVICE, compute_type=WHISPER_COMPUTE_TYPE)
+    print("✅ Whisper model loaded.")
+    return model
 
 
 class SpeechToText:
     def __init__(self):
-        print(f"Loading Whisper model ({WHISPER_MODEL_SIZE})...")
-        self.model = WhisperModel(
-            WHISPER_MODEL_SIZE,
-            device=WHISPER_DEVICE,
-            compute_type=WHISPER_COMPUTE_TYPE
-        )
-        print("✅ Whisper model loaded.")
+        self.model = _load_model(WHISPER_MODEL_SIZE)
+        self.fast_model = _load_model(WHISPER_FAST_MODEL_SIZE) if STT_TIERED else None
+        self.language = None  # Pinned for the session once detected confidently (tiered mode)
+        self.fallbacks = 0  # Fast-tier results redone on the main model
+        self.tiers = {"main": TierStats(WHISPER_MODEL_SIZE)}
+        if self.fast_model is not None:
+            self.tiers["fast"] = TierStats(WHISPER_FAST_MODEL_SIZE)
+        if STT_WARMUP:
+            self.warm_up()
     
-    def transcribe(self, audio: np.ndarray) -> str:
+    def warm_up(self):
+        """Decode a second of silence on each model so the first real utterance doesn't pay for lazy init."""
+        silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+        start = time.perf_counter()
+        for model in filter(None, (self.fast_model, self.model)):
+            segments, _ = model.transcribe(silence, beam_size=1, vad_filter=False)
+            list(segments)  # Decoding is lazy; consume it
+        print(f"✅ STT warmed up ({(time.perf_counter() - start) * 1000:.0f} ms)")
+    
+    def _pin_language(self, language: str | None, probability: float):
+        if self.fast_model is not None and self.language is None and language \
+                and probability >= STT_PIN_LANGUAGE_PROB:
+            self.language = language
+            print(f"📌 Language pinned for this session: {language}")
+    
+    def reset_language(self):
+        """Forget the pinned language (e.g. a different speaker)."""
+        self.language = None
+    
+    def start_stream(self) -> StreamingTranscription:
+        """Begin an incremental transcription; feed() it audio, then finish it with finish_stream()."""
+        if self.fast_model is not None:
+            return StreamingTranscription(self.fast_model, self.language, final_beam_size=1)
+        return StreamingTranscription(self.model)
+    
+    def finish_stream(self, stream: StreamingTranscription, audio: np.ndarray) -> str:
         """
-        Transcribe audio to text.
-        
-        Args:
-            audio: numpy array of audio samples (float32, mono, 16kHz)
-        
-        Returns:
-            Transcribed text string
+        Finish a stream from start_stream(). On the fast tier, a low-confidence
+        result is redone on the main model using the full utterance `audio`.
         """
-        # Ensure audio is float32
-        if audio.dtype != np.float32:
-            audio = audio.astype(np.float32)
+        text = stream.finish()
+        tier = "fast" if stream.model is self.fast_model else "main"
+        self.tiers[tier].record(stream.audio_seconds, stream.decode_seconds)
+        if tier == "main":
+            return text
         
-        # Normalize audio
-        if np.abs(audio).max() > 1.0:
-            audio = audio / np.abs(audio).max()
+        self._pin_language(stream.language, stream.language_probability)
+        logprob = stream.avg_logprob()
+        if text and logprob >= STT_FALLBACK_LOGPROB:
+            return text
+        self.fallbacks += 1
+        print(f"↪️ Low confidence ({logprob:.2f}), retrying with {WHISPER_MODEL_SIZE}...")
+        return self._transcribe_with("main", _prepare(audio))
+    
+    def _transcribe_with(self, tier: str, audio: np.ndarray) -> str:
+        fast = tier == "fast"
+        model = self.fast_model if fast else self.model
+        start = time.perf_counter()
         
         # Transcribe with language detection
         # Whisper works well with Hindi, English, and mixed language
-        segments, info = self.model.transcribe(
+        segments, info = model.transcribe(
             audio,
-            beam_size=5,
-            language=None,  # Auto-detect language
+            beam_size=1 if fast else 5,
+            language=self.language,  # None = auto-detect
             vad_filter=True,  # Filter out non-speech
             vad_parameters=dict(
                 min_silence_duration_ms=500,
                 speech_pad_ms=200
             )
         )
+        segments = list(segments)  # Decoding is lazy; time all of it
+        self.tiers[tier].record(len(audio) / SAMPLE_RATE, time.perf_counter() - start)
         
-        # Combine all segments
-        text_parts = []
-        for segment in segments:
-            text_parts.append(segment.text.strip())
+        full_text = " ".join(segment.text.strip() for segment in segments).strip()
         
-        full_text = " ".join(text_parts).strip()
+        if fast:
+            self._pin_language(info.language, info.language_probability)
+            # Duration-weighted mean of Whisper's per-segment average log-probability
+            duration = sum(s.end - s.start for s in segments)
+            logprob = sum(s.avg_logprob * (s.end - s.start) for s in segments) / duration if duration else float("-inf")
+            if not full_text or logprob < STT_FALLBACK_LOGPROB:
+                self.fallbacks += 1
+                print(f"↪️ Low confidence ({logprob:.2f}), retrying with {WHISPER_MODEL_SIZE}...")
+                return self._transcribe_with("main", audio)
         
         if full_text:
             print(f"📝 Transcribed: {full_text}")
@@ -64,6 +340,32 @@ class SpeechToText:
             print(f"   (Detected language: {detected_lang})")
         
         return full_text
+    
+    def transcribe(self, audio: np.ndarray) -> str:
+        """
+        Transcribe audio to text.
+        
+        Args:
+            audio: numpy array of audio samples (float32, mono, 16kHz)
+        
+        Returns:
+            Transcribed text string
+        """
+        # Ensure float32 and normalize
+        audio = _prepare(audio)
+        
+        # Short utterances, or any once the language is known, try the fast tier first
+        use_fast = self.fast_model is not None and (
+            len(audio) <= STT_FAST_MAX_SECONDS * SAMPLE_RATE or self.language is not None
+        )
+        return self._transcribe_with("fast" if use_fast else "main", audio)
+    
+    def stats(self) -> dict:
+        return {
+            "tiers": {name: tier.stats() for name, tier in self.tiers.items()},
+            "fallbacks": self.fallbacks,
+            "language": self.language,
+        }
 
 
 # Singleton instance
@@ -3,18 +3,76 @@ Text-to-Speech Module with Interruption Support
 
 Supports edge-tts (online) and pyttsx3 (offline).
 Plays audio in background with ability to stop mid-playback.
+
+Replies are split into sentences/phrases and pipelined: the next
+segment is synthesized while the current one plays, so time to first
+audio is roughly the time to synthesize one short phrase.
+
+Everything stays in memory: edge-tts MP3 chunks are streamed from one
+long-lived event loop, decoded to PCM as they arrive (PyAV) and played
+through a sounddevice output stream, so playback starts with the first
+decodable frames.
+
+Short segments are cached (tts_cache.py), so repeated phrases like
+greetings and acknowledgements play without any synthesis at all.
 """
 
 import asyncio
+import collections
+import re
 import threading
 import tempfile
+import time
+import wave
 import os
 from enum import Enum
 
+import av
 import edge_tts
-import pygame
+import numpy as np
+import sounddevice as sd
+
+from config import (
+    TTS_ENGINE, EDGE_TTS_VOICE, INTERRUPTION_CHECK_INTERVAL_MS,
+    TTS_PIPELINE, TTS_LOOKAHEAD_SEGMENTS, TTS_FIRST_SEGMENT_CHARS, TTS_MAX_SEGMENT_CHARS,
+    TTS_SAMPLE_RATE, TTS_CACHE_ENABLED
+)
+from tts_cache import tts_cache
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?।])\s+")
+_PHRASE_BREAK = re.compile(r"(?<=[,;:])\s+")
+_MIN_SEGMENT_CHARS = 12  # Shorter pieces are merged into a neighbour
 
-from config import TTS_ENGINE, EDGE_TTS_VOICE
+
+def split_segments(text: str) -> list[str]:
+    """Split a reply into sentences, breaking long ones (and a long first one) at phrase boundaries."""
+    segments = []
+    for sentence in _SENTENCE_BREAK.split(text.strip()):
+        limit = TTS_FIRST_SEGMENT_CHARS if not segments else TTS_MAX_SEGMENT_CHARS
+        if len(sentence) <= limit:
+            segments.append(sentence)
+            continue
+        current = ""
+        for phrase in _PHRASE_BREAK.split(sentence):
+            if current and len(current) + len(phrase) + 1 > limit:
+                segments.append(current)
+                current = phrase
+                limit = TTS_MAX_SEGMENT_CHARS
+            else:
+                current = f"{current} {phrase}".strip()
+        if current:
+            segments.append(current)
+
+    # Merge fragments that are too short to be worth a separate request
+    merged = []
+    for segment in segments:
+        if merged and len(segment) < _MIN_SEGMENT_CHARS:
+            merged[-1] = f"{merged[-1]} {segment}"
+        elif merged and len(merged[-1]) < _MIN_SEGMENT_CHARS:
+            merged[-1] = f"{merged[-1]} {segment}"
+        else:
+            merged.append(segment)
+    return [m for m in merged if m.strip()]
 
 
 class PlaybackStatus(Enum):
@@ -23,157 +81,308 @@ class PlaybackStatus(Enum):
     ERROR = "error"
 
 
+class MP3Decoder:
+    """Incremental MP3 -> mono float32 PCM at TTS_SAMPLE_RATE."""
+
+    def __init__(self):
+        self._codec = av.CodecContext.create("mp3", "r")
+        self._resampler = av.AudioResampler(format="flt", layout="mono", rate=TTS_SAMPLE_RATE)
+
+    def _decode_packet(self, packet) -> list[np.ndarray]:
+        try:
+            frames = self._codec.decode(packet)
+        except av.error.InvalidDataError:
+            return []  # e.g. an ID3/Xing header packet
+        return [
+            resampled.to_ndarray().reshape(-1)
+            for frame in frames
+            for resampled in self._resampler.resample(frame)
+        ]
+
+    def decode(self, data: bytes) -> list[np.ndarray]:
+        pcm = []
+        for packet in self._codec.parse(data):
+            pcm.extend(self._decode_packet(packet))
+        return pcm
+
+    def flush(self) -> list[np.ndarray]:
+        pcm = []
+        for packet in self._codec.parse(None):
+            pcm.extend(self._decode_packet(packet))
+        pcm.extend(self._decode_packet(None))
+        pcm.extend(r.to_ndarray().reshape(-1) for r in self._resampler.resample(None))
+        return pcm
+
+
+class PCMPlayer:
+    """
+    sounddevice output fed from a queue of PCM blocks.
+
+    None in the queue marks the end of a segment, so the producer can tell
+    how far playback has got (played_segments).
+    """
+
+    def __init__(self):
+        self._blocks = collections.deque()
+        self._current = None  # Block being played and offset into it
+        self._offset = 0
+        self._finished = False
+        self._done = threading.Event()
+        self.played_segments = 0
+        self.first_audio_at = None  # perf_counter when the first real sample went out
+        self.underruns = 0
+        self._stream = sd.OutputStream(
+            samplerate=TTS_SAMPLE_RATE, channels=1, dtype="float32", callback=self._callback
+        )
+
+    def _callback(self, outdata, frames, time_info, status):
+        filled = 0
+        out = outdata[:, 0]
+        while filled < frames:
+            if self._current is None:
+                if not self._blocks:
+                    break
+                block = self._blocks.popleft()
+                if block is None:
+                    self.played_segments += 1
+                    continue
+                self._current, self._offset = block, 0
+            n = min(frames - filled, self._current.size - self._offset)
+            out[filled:filled + n] = self._current[self._offset:self._offset + n]
+            filled += n
+            self._offset += n
+            if self._offset >= self._current.size:
+                self._current = None
+        if filled and self.first_audio_at is None:
+            self.first_audio_at = time.perf_counter()
+        if filled < frames:
+            out[filled:] = 0
+            if self._finished and not self._blocks and self._current is None:
+                self._done.set()
+                raise sd.CallbackStop
+            if self.first_audio_at is not None:
+                self.underruns += 1
+
+    def start(self):
+        self._stream.start()
+
+    def feed(self, pcm: np.ndarray):
+        self._blocks.append(pcm)
+
+    def end_segment(self):
+        self._blocks.append(None)
+
+    def finish(self):
+        """No more audio is coming; the stream stops once the queue drains."""
+        self._finished = True
+
+    def wait(self, timeout: float) -> bool:
+        """True once everything fed has been played."""
+        return self._done.wait(timeout)
+
+    def close(self):
+        try:
+            self._stream.abort()
+            self._stream.close()
+        except Exception:
+            pass
+        self._done.set()
+
+
 class TextToSpeech:
     def __init__(self):
-        # Initialize pygame mixer for audio playback
-        pygame.mixer.init()
-        
         self._is_playing = False
-        self._should_stop = False
+        self._stop_event = None  # threading.Event of the current playback
         self._lock = threading.Lock()
-        self._playback_thread = None
-        self._temp_file = None
-        
+        self._synthesis = None  # concurrent.futures.Future of the in-flight synthesis
+        self.last_time_to_first_audio = None  # Seconds, for the most recent reply
+
+        # One long-lived loop for all edge-tts streaming, instead of asyncio.run per reply
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name="tts-loop", daemon=True)
+        self._loop_thread.start()
+
         print(f"✅ TTS initialized (engine: {TTS_ENGINE})")
-    
-    def _cleanup_temp_file(self):
-        """Remove temporary audio file if it exists."""
-        if self._temp_file and os.path.exists(self._temp_file):
-            try:
-                os.remove(self._temp_file)
-            except:
-                pass
-            self._temp_file = None
-    
-    async def _generate_audio_edge_tts(self, text: str, output_path: str):
-        """Generate audio using edge-tts."""
+
+    async def _stream_edge_tts(self, text: str, sink):
+        """Stream one segment from edge-tts, decoding and passing PCM to sink as chunks arrive."""
+        decoder = MP3Decoder()
         communicate = edge_tts.Communicate(text, EDGE_TTS_VOICE)
-        await communicate.save(output_path)
-    
-    def _generate_audio(self, text: str) -> str | None:
-        """Generate audio file from text and return file path."""
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                for pcm in decoder.decode(chunk["data"]):
+                    sink(pcm)
+        for pcm in decoder.flush():
+            sink(pcm)
+
+    def _render_pyttsx3(self, text: str) -> np.ndarray:
+        """pyttsx3 can only render to a file, so this fallback still uses a short-lived temp WAV."""
+        import pyttsx3
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
         try:
-            # Create temp file for audio
-            fd, temp_path = tempfile.mkstemp(suffix=".mp3")
-            os.close(fd)
-            
-            if TTS_ENGINE == "edge-tts":
-                # Run async edge-tts in sync context
-                asyncio.run(self._generate_audio_edge_tts(text, temp_path))
-            else:
-                # Fallback to pyttsx3
-                import pyttsx3
-                engine = pyttsx3.init()
-                engine.save_to_file(text, temp_path)
-                engine.runAndWait()
-            
-            return temp_path
-            
-        except Exception as e:
-            print(f"❌ TTS generation error: {e}")
-            return None
-    
-    def _play_audio_blocking(self, audio_path: str, check_interrupt_fn) -> PlaybackStatus:
-        """Play audio file with interruption checking."""
+            engine = pyttsx3.init()
+            engine.save_to_file(text, path)
+            engine.runAndWait()
+            with wave.open(path, "rb") as f:
+                rate, channels, width = f.getframerate(), f.getnchannels(), f.getsampwidth()
+                raw = f.readframes(f.getnframes())
+        finally:
+            os.remove(path)
+        dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[width]
+        pcm = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+        pcm = (pcm - 128) / 128 if width == 1 else pcm / np.iinfo(dtype).max
+        pcm = pcm.reshape(-1, channels).mean(axis=1)
+        if rate != TTS_SAMPLE_RATE:
+            positions = np.arange(0, len(pcm), rate / TTS_SAMPLE_RATE)
+            pcm = np.interp(positions, np.arange(len(pcm)), pcm).astype(np.float32)
+        return pcm
+
+    async def _render(self, text: str, sink):
+        """Synthesize one segment with the configured engine, then cache it if it's short enough."""
+        pieces = []
+
+        def collect(pcm: np.ndarray):
+            pieces.append(pcm)
+            sink(pcm)
+
+        if TTS_ENGINE == "edge-tts":
+            await self._stream_edge_tts(text, collect)
+        else:
+            collect(await asyncio.to_thread(self._render_pyttsx3, text))
+
+        # Only reached when the segment finished; cancelled or failed ones are never cached
+        if TTS_CACHE_ENABLED and pieces and tts_cache.cacheable(text):
+            await asyncio.to_thread(tts_cache.put, text, np.concatenate(pieces))
+
+    async def _synthesize(self, segments: list[str], player: PCMPlayer):
+        """Producer: synthesize segments in order, at most TTS_LOOKAHEAD_SEGMENTS ahead of playback."""
+        try:
+            for index, segment in enumerate(segments):
+                cached = tts_cache.get(segment) if TTS_CACHE_ENABLED else None
+                if cached is not None:
+                    player.feed(cached)
+                else:
+                    while index - player.played_segments > TTS_LOOKAHEAD_SEGMENTS:
+                        await asyncio.sleep(INTERRUPTION_CHECK_INTERVAL_MS / 1000)
+                    await self._render(segment, player.feed)
+                player.end_segment()
+        finally:
+            player.finish()
+
+    async def _prewarm(self, texts: list[str]):
+        for text in texts:
+            if tts_cache.contains(text):
+                continue
+            try:
+                await self._render(text, lambda pcm: None)
+            except Exception as e:
+                print(f"⚠️ TTS pre-warm stopped: {e}")
+                return
+        print(f"✅ TTS cache warmed ({len(texts)} phrases)")
+
+    def prewarm(self, texts: list[str]):
+        """Synthesize common phrases into the cache in the background."""
+        if TTS_CACHE_ENABLED and texts:
+            asyncio.run_coroutine_threadsafe(self._prewarm(texts), self._loop)
+
+    def _play(self, segments: list[str], check_interrupt_fn, stop_event: threading.Event,
+              start: float) -> PlaybackStatus:
+        """Play while synthesizing; stop both together on interruption."""
+        player = PCMPlayer()
+        synthesis = asyncio.run_coroutine_threadsafe(self._synthesize(segments, player), self._loop)
+        with self._lock:
+            self._synthesis = synthesis
+            self._stop_event = stop_event
+            self._is_playing = True
+        player.start()
+
         try:
-            pygame.mixer.music.load(audio_path)
-            pygame.mixer.music.play()
-            
-            with self._lock:
-                self._is_playing = True
-            
             # Poll for completion or interruption
-            while pygame.mixer.music.get_busy():
+            while not player.wait(INTERRUPTION_CHECK_INTERVAL_MS / 1000):
                 # Check if stop was requested
-                with self._lock:
-                    if self._should_stop:
-                        pygame.mixer.music.stop()
-                        return PlaybackStatus.INTERRUPTED
-                
+                if stop_event.is_set():
+                    return PlaybackStatus.INTERRUPTED
+
                 # Check for user speech (interruption)
                 if check_interrupt_fn and check_interrupt_fn():
                     print("🛑 User interrupted! Stopping playback...")
-                    pygame.mixer.music.stop()
                     return PlaybackStatus.INTERRUPTED
-                
-                pygame.time.wait(50)  # Check every 50ms
-            
+
+            # Everything synthesized has played; surface synthesis failures
+            try:
+                synthesis.result(timeout=1.0)
+            except Exception as e:
+                print(f"❌ TTS generation error: {e}")
+                return PlaybackStatus.ERROR
             return PlaybackStatus.COMPLETED
-            
+
         except Exception as e:
             print(f"❌ Playback error: {e}")
             return PlaybackStatus.ERROR
         finally:
+            # Cancels the edge-tts stream mid-request, not just at a segment boundary
+            synthesis.cancel()
+            player.close()
+            if player.first_audio_at is not None:
+                self.last_time_to_first_audio = player.first_audio_at - start
             with self._lock:
+                self._synthesis = None
+                self._stop_event = None
                 self._is_playing = False
-    
-    def speak(self, text: str, check_interrupt_fn=None) -> PlaybackStatus:
+
+    def speak(self, text: str, check_interrupt_fn=None, stop_event: threading.Event = None) -> PlaybackStatus:
         """
         Convert text to speech and play it.
-        
+
         Args:
             text: Text to speak
             check_interrupt_fn: Optional function that returns True if user is speaking
-        
+            stop_event: Optional per-reply event; setting it (even before this runs) stops playback
+
         Returns:
             PlaybackStatus indicating if playback completed or was interrupted
         """
         if not text or not text.strip():
             return PlaybackStatus.COMPLETED
-        
+
+        # Owned by the caller, so a stop requested before this thread even ran isn't lost
+        stop_event = stop_event or threading.Event()
+        if stop_event.is_set():
+            return PlaybackStatus.INTERRUPTED
+
         print(f"🔊 Speaking: {text[:50]}...")
-        
-        # Reset stop flag
-        with self._lock:
-            self._should_stop = False
-        
-        # Generate audio
-        self._cleanup_temp_file()
-        audio_path = self._generate_audio(text)
-        
-        if not audio_path:
-            return PlaybackStatus.ERROR
-        
-        self._temp_file = audio_path
-        
-        # Play audio with interruption checking
-        status = self._play_audio_blocking(audio_path, check_interrupt_fn)
-        
-        # Cleanup
-        self._cleanup_temp_file()
-        
+
+        self.last_time_to_first_audio = None
+        segments = split_segments(text) if TTS_PIPELINE else [text]
+        status = self._play(segments, check_interrupt_fn, stop_event, time.perf_counter())
+
         if status == PlaybackStatus.COMPLETED:
             print("✅ Finished speaking.")
         elif status == PlaybackStatus.INTERRUPTED:
             print("⏹️ Speech interrupted.")
-        
+
         return status
-    
+
     def stop(self):
         """Stop current playback immediately."""
         with self._lock:
-            self._should_stop = True
-        
-        try:
-            if pygame.mixer.get_init() and pygame.mixer.music.get_busy():
-                pygame.mixer.music.stop()
-        except:
-            pass
-    
+            stop_event = self._stop_event
+            synthesis = self._synthesis
+        if stop_event is not None:
+            stop_event.set()
+        if synthesis is not None:
+            synthesis.cancel()
+
     def is_playing(self) -> bool:
         """Check if currently playing audio."""
         with self._lock:
             return self._is_playing
-    
+
     def cleanup(self):
         """Cleanup resources."""
         self.stop()
-        self._cleanup_temp_file()
-        try:
-            if pygame.mixer.get_init():
-                pygame.mixer.quit()
-        except:
-            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
 
 
 # Singleton instance
@@ -0,0 +1,197 @@
+"""
+TTS Audio Cache
+
+Content-addressed cache of synthesized speech, keyed by engine, voice,
+sample rate and text. Two tiers, each LRU-evicted by total bytes:
+- memory: decoded float32 PCM, ready to play instantly
+- disk: 16-bit PCM files in TTS_CACHE_DIR, survive restarts
+
+Can be pre-warmed with the most common reply segments in chatbot.db.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from config import (
+    TTS_ENGINE, EDGE_TTS_VOICE, TTS_SAMPLE_RATE,
+    TTS_CACHE_DIR, TTS_CACHE_MEMORY_BYTES, TTS_CACHE_DISK_BYTES, TTS_CACHE_MAX_CHARS,
+    TTS_PREWARM_SCAN, CHATBOT_DB_PATH
+)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+class TTSCache:
+    def __init__(self, directory: Path = TTS_CACHE_DIR,
+                 memory_bytes: int = TTS_CACHE_MEMORY_BYTES, disk_bytes: int = TTS_CACHE_DISK_BYTES):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._memory_used = 0
+        self._disk: OrderedDict[str, int] = OrderedDict()  # key -> file size, oldest first
+        self._disk_used = 0
+        self.hits = self.disk_hits = self.misses = 0
+        self._load_index()
+
+    def key(self, text: str) -> str:
+        raw = f"{TTS_ENGINE}|{EDGE_TTS_VOICE}|{TTS_SAMPLE_RATE}|{_normalize(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def cacheable(self, text: str) -> bool:
+        return 0 < len(_normalize(text)) <= TTS_CACHE_MAX_CHARS
+
+    def contains(self, text: str) -> bool:
+        """In either tier, without counting as a lookup."""
+        key = self.key(text)
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.pcm"
+
+    def _load_index(self):
+        """Rebuild the disk LRU order from file access times."""
+        if not self.directory.exists():
+            return
+        entries = []
+        for path in self.directory.glob("*.pcm"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_used += size
+
+    def _remember(self, key: str, pcm: np.ndarray):
+        """Put into the memory tier. Caller holds the lock."""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = pcm
+        self._memory_used += pcm.nbytes
+        while self._memory_used > self.memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= evicted.nbytes
+
+    def get(self, text: str) -> np.ndarray | None:
+        """Cached PCM (float32 at TTS_SAMPLE_RATE) for text, or None."""
+        if not self.cacheable(text):
+            return None
+        key = self.key(text)
+        with self._lock:
+            pcm = self._memory.get(key)
+            if pcm is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return pcm
+            on_disk = key in self._disk
+
+        if on_disk:
+            path = self._path(key)
+            try:
+                pcm = np.fromfile(path, dtype="<i2").astype(np.float32) / 32767
+                os.utime(path)  # Touch for LRU order across restarts
+            except OSError:
+                pcm = None
+            with self._lock:
+                if pcm is not None:
+                    self._disk.move_to_end(key)
+                    self._remember(key, pcm)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return pcm
+                self._disk_used -= self._disk.pop(key, 0)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text: str, pcm: np.ndarray):
+        """Store freshly synthesized PCM in both tiers."""
+        if not self.cacheable(text) or pcm.size == 0:
+            return
+        key = self.key(text)
+        pcm = np.ascontiguousarray(pcm, dtype=np.float32)
+        with self._lock:
+            self._remember(key, pcm)
+            if key in self._disk:
+                return
+
+        data = (np.clip(pcm, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+        path = self._path(key)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"⚠️ TTS cache write failed: {e}")
+            return
+
+        evict = []
+        with self._lock:
+            self._disk[key] = len(data)
+            self._disk_used += len(data)
+            while self._disk_used > self.disk_bytes and len(self._disk) > 1:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_used -= size
+                evict.append(old_key)
+        for old_key in evict:
+            try:
+                self._path(old_key).unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_bytes": self._memory_used,
+                "disk_bytes": self._disk_used,
+                "disk_entries": len(self._disk),
+            }
+
+
+def common_reply_segments(split_fn, limit: int, db_path: Path = CHATBOT_DB_PATH) -> list[str]:
+    """Most frequent cacheable segments of recent assistant replies (seen at least twice)."""
+    if limit <= 0 or not db_path.exists():
+        return []
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(
+                "SELECT content FROM messages WHERE role = 'assistant' ORDER BY id DESC LIMIT ?",
+                (TTS_PREWARM_SCAN,)
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not read replies for TTS pre-warm: {e}")
+        return []
+
+    counts = Counter()
+    for (content,) in rows:
+        for segment in split_fn(content or ""):
+            if len(_normalize(segment)) <= TTS_CACHE_MAX_CHARS:
+                counts[_normalize(segment)] += 1
+    return [text for text, count in counts.most_common(limit) if count >= 2]
+
+
+# Singleton instance
+tts_cache = TTSCache()
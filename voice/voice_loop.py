@@ -11,16 +11,24 @@ Main orchestrator that:
 
 Only complete turns are considered valid for conversation memory.
 Interrupted responses are discarded.
+
+Runs on asyncio: capture and utterance detection never stop, and each
+turn (STT -> API -> TTS) is a task. As soon as the user starts a new
+utterance, the previous turn is cancelled wherever it is: its HTTP
+request is aborted and its TTS synthesis and playback are stopped. The
+backend notices the dropped connection and doesn't store that reply, but
+only once its pipeline finishes, so its LLM calls still run.
 """
 
-import time
-import signal
-import sys
+import asyncio
+import threading
 
 from audio_input import audio_input
 from stt import stt
-from tts import tts, PlaybackStatus
+from tts import tts, PlaybackStatus, split_segments
+from tts_cache import tts_cache, common_reply_segments
 from api_client import api_client
+from config import STT_STREAMING, TTS_CACHE_ENABLED, TTS_PREWARM_COUNT
 
 
 class VoiceLoop:
@@ -28,46 +36,76 @@ class VoiceLoop:
         self.running = False
         self.interrupted_count = 0
         self.completed_turns = 0
+        self.cancelled_turns = 0  # Dropped before reaching playback because the user spoke again
+        self._loop = None
+        self._main_task = None
+        self._turn_task = None
+        self._warm_up_task = None
         
     def _check_for_interruption(self) -> bool:
         """Check if user is speaking during TTS playback."""
         return audio_input.check_for_interruption()
     
-    def run_one_turn(self) -> bool:
+    def _on_speech(self):
+        """Listener thread: a new utterance is definitely speech."""
+        self._loop.call_soon_threadsafe(self._new_utterance_started)
+    
+    def _new_utterance_started(self):
+        # Whatever the previous turn was doing is stale now
+        if self._turn_task is not None and not self._turn_task.done():
+            self._turn_task.cancel()
+        # Have a live connection ready by the time the transcript is
+        if self._warm_up_task is None or self._warm_up_task.done():
+            self._warm_up_task = asyncio.create_task(api_client.warm_up())
+    
+    async def _speak(self, reply: str) -> PlaybackStatus:
+        audio_input.arm_interruption()
+        # This reply's own stop signal: it works even if the thread hasn't started yet,
+        # and can't leak into the next turn's playback
+        stop_event = threading.Event()
+        try:
+            return await asyncio.to_thread(tts.speak, reply, self._check_for_interruption, stop_event)
+        except asyncio.CancelledError:
+            stop_event.set()  # Playback stops and the synthesis in flight is cancelled
+            raise
+    
+    async def run_one_turn(self, audio, stream=None) -> bool:
         """
-        Run one complete conversation turn.
+        Run one conversation turn for a captured utterance.
         
         Returns:
             True if turn completed successfully
             False if interrupted or failed
         """
-        # Step 1: Wait for user to speak
-        audio = audio_input.wait_for_utterance()
-        
-        if audio is None:
-            # Listening was stopped
-            return False
-        
-        # Step 2: Convert speech to text
-        user_text = stt.transcribe(audio)
-        
-        if not user_text or not user_text.strip():
-            print("⚠️ Could not understand. Please try again.")
-            return False
-        
-        # Step 3: Send to chatbot API
-        print(f"\n👤 You: {user_text}")
-        response = api_client.chat(user_text)
-        
-        if not response["success"]:
-            print("❌ Failed to get response from chatbot.")
-            return False
-        
-        reply = response["reply"]
-        print(f"🤖 Bot: {reply}")
-        
-        # Step 4: Speak the response with interruption detection
-        playback_status = tts.speak(reply, self._check_for_interruption)
+        try:
+            # Step 1: Convert speech to text (only the unconfirmed tail when streaming)
+            if stream is not None:
+                user_text = await asyncio.to_thread(stt.finish_stream, stream, audio)
+            else:
+                user_text = await asyncio.to_thread(stt.transcribe, audio)
+            
+            if not user_text or not user_text.strip():
+                print("⚠️ Could not understand. Please try again.")
+                return False
+            
+            # Step 2: Send to chatbot API
+            print(f"\n👤 You: {user_text}")
+            response = await api_client.chat(user_text)
+            
+            if not response["success"]:
+                print("❌ Failed to get response from chatbot.")
+                return False
+            
+            reply = response["reply"]
+            print(f"🤖 Bot: {reply}")
+            
+            # Step 3: Speak the response with interruption detection
+            playback_status = await self._speak(reply)
+        
+        except asyncio.CancelledError:
+            self.cancelled_turns += 1
+            print("⏹️ New utterance, dropping the previous turn.")
+            raise
         
         if playback_status == PlaybackStatus.INTERRUPTED:
             # User interrupted - this response should not count
@@ -84,6 +122,44 @@ class VoiceLoop:
             # Error
             return False
     
+    async def _listen(self):
+        """Wait for utterances back to back; each one starts a turn and supersedes the last."""
+        while self.running:
+            # Streaming STT decodes while they talk
+            stream = stt.start_stream() if STT_STREAMING else None
+            audio = await asyncio.to_thread(audio_input.wait_for_utterance, stream, self._on_speech)
+            
+            if audio is None:
+                # Listening was stopped
+                if stream is not None:
+                    stream.close()
+                return
+            
+            if self._turn_task is not None and not self._turn_task.done():
+                self._turn_task.cancel()
+            # Capture goes on while the turn runs, so keep our own copy
+            self._turn_task = asyncio.create_task(self.run_one_turn(audio.copy(), stream))
+            if stream is not None:
+                # Even a turn cancelled before it ran must release the stream's worker and audio
+                self._turn_task.add_done_callback(lambda _, stream=stream: stream.close())
+    
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        self._main_task = asyncio.current_task()
+        self.running = True
+        
+        # Pre-synthesize the bot's most common phrases while we wait for the user
+        if TTS_CACHE_ENABLED:
+            tts.prewarm(common_reply_segments(split_segments, TTS_PREWARM_COUNT))
+        
+        # Start listening
+        audio_input.start_listening()
+        
+        try:
+            await self._listen()
+        finally:
+            await self._shutdown()
+    
     def start(self):
         """Start the voice interaction loop."""
         print("\n" + "="*50)
@@ -95,44 +171,52 @@ class VoiceLoop:
         print("Press Ctrl+C to exit.")
         print("="*50 + "\n")
         
-        self.running = True
-        
-        # Start listening
-        audio_input.start_listening()
-        
         try:
-            while self.running:
-                self.run_one_turn()
-                
-                # Small delay to prevent tight loop
-                time.sleep(0.1)
-                
-        except KeyboardInterrupt:
-            print("\n\n👋 Goodbye!")
-        finally:
-            self.stop()
+            # Ctrl+C (or stop()) cancels the main task, which shuts everything down
+            asyncio.run(self._run())
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+        print("\n👋 Goodbye!")
     
     def stop(self):
-        """Stop the voice loop and cleanup."""
+        """Ask the voice loop to stop (safe to call from any thread)."""
+        self.running = False
+        if self._loop is not None and self._main_task is not None:
+            self._loop.call_soon_threadsafe(self._main_task.cancel)
+    
+    async def _shutdown(self):
+        """Cancel in-flight work, release devices and print stats."""
         self.running = False
+        for task in (self._turn_task, self._warm_up_task):
+            if task is not None and not task.done():
+                task.cancel()
+        capture = audio_input.stats()
         audio_input.stop_listening()
         tts.cleanup()
+        await api_client.close()
         
         print(f"\n📊 Session Stats:")
         print(f"   Completed turns: {self.completed_turns}")
         print(f"   Interrupted: {self.interrupted_count}")
+        print(f"   Superseded by a new utterance: {self.cancelled_turns}")
+        print(f"   Audio overruns: {capture['overruns']} ({capture['overrun_samples']} samples lost)")
+        print(f"   VAD max backlog: {capture['vad_max_backlog_chunks']} chunks")
+        endpointing = capture["endpointing"]
+        print(f"   End-of-turn delay: p50 {endpointing['delay_ms_p50']} ms, p95 {endpointing['delay_ms_p95']} ms "
+              f"(threshold now {endpointing['threshold_ms']} ms)")
+        print(f"   False cutoffs: {endpointing['false_cutoffs']} ({endpointing['false_cutoff_rate']:.0%})")
+        transcription = stt.stats()
+        for name, tier in transcription["tiers"].items():
+            rtf = f"{tier['rtf']:.2f}" if tier["rtf"] is not None else "n/a"
+            print(f"   STT {name} tier ({tier['model']}): {tier['utterances']} utterances, "
+                  f"{tier['audio_seconds']:.1f} s audio, RTF {rtf}")
+        if "fast" in transcription["tiers"]:
+            print(f"   STT fallbacks to {transcription['tiers']['main']['model']}: {transcription['fallbacks']}")
+        if TTS_CACHE_ENABLED:
+            cache = tts_cache.stats()
+            print(f"   TTS cache: {cache['hits']} hits ({cache['disk_hits']} from disk), {cache['misses']} misses "
+                  f"({cache['hit_rate']:.0%}), {cache['disk_bytes'] // 1024} KB on disk")
 
 
 # Singleton instance
 voice_loop = VoiceLoop()
-
-
-def signal_handler(sig, frame):
-    """Handle Ctrl+C gracefully."""
-    print("\n\nShutting down...")
-    voice_loop.stop()
-    sys.exit(0)
-
-
-# Register signal handler
-signal.signal(signal.SIGINT, signal_handler)